@@ -0,0 +1,59 @@
+from typing import Dict, List
+
+# parameters of the generated programs, from a smoke test to a minutes-long run
+SIZES: Dict[str, Dict[str, int]] = {
+    "small": {"iterations": 10, "functions": 2, "classes": 1, "depth": 1, "list_size": 5},
+    "medium": {"iterations": 100, "functions": 10, "classes": 5, "depth": 2, "list_size": 50},
+    "large": {"iterations": 1000, "functions": 25, "classes": 10, "depth": 3, "list_size": 200},
+}
+
+
+def generate_program(iterations: int, functions: int, classes: int, depth: int, list_size: int) -> str:
+    """
+        Returns a program with the given loop iterations, number of functions and classes, nesting
+        depth and list size, whose last line is the slicing criterion
+    """
+    lines: List[str] = []
+    for c in range(classes):
+        lines += [
+            f"class Item{c}:",
+            "    def __init__(self, value):",
+            "        self.value = value",
+            "",
+        ]
+    for f in range(functions):
+        lines += [
+            f"def compute{f}(x):",
+            "    total = 0",
+            f"    for i in range({iterations}):",
+        ]
+        indent = "        "
+        # the analyses do not handle nested ifs, so nesting comes from loops around a single if
+        for level in range(1, depth):
+            lines.append(f"{indent}for j{level} in range(2):")
+            indent += "    "
+        lines += [
+            f"{indent}if i % 2 != 1:",
+            f"{indent}    total += x",
+            "    return total",
+            "",
+        ]
+    lines += [
+        f"values = [{', '.join(str(i) for i in range(list_size))}]",
+        "items = []",
+        "result = 0",
+        "unused = 0",
+    ]
+    for f in range(functions):
+        lines += [
+            f"value{f} = values[{f % list_size}]",
+            f"result += compute{f}(value{f})",
+            f"unused += value{f}",
+        ]
+    for c in range(classes):
+        lines += [
+            f"item{c} = Item{c}(result)",
+            f"items.append(item{c}.value)",
+        ]
+    lines.append("print(result) # slicing criterion")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,170 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import runpy
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from statistics import median
+from os.path import dirname, join, realpath
+from typing import Any, Dict, List
+
+from generate import SIZES, generate_program
+
+BENCHMARK_DIR = dirname(realpath(__file__))
+BASELINE_FILE = join(BENCHMARK_DIR, "baseline.json")
+PHASES = ("instrument", "execute", "end_execution")
+# differences below this many seconds are noise, whatever the ratio
+NOISE_FLOOR = 0.005
+
+
+def peak_memory_kb() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def measure(size: str, analysis: str, preslice: bool = False) -> Dict[str, Any]:
+    """
+        Instruments, runs and slices one generated program with one analysis, in this process
+    """
+    from dynamicslicing.instrument_cache import CACHE_DIR_VARIABLE, instrument_file
+    from dynamicslicing.preslice import relevant_lines
+    from dynapyt.utils.hooks import get_hooks_from_analysis
+    import dynapyt.runtime as _rt
+    from dynamicslicing.offline import ANALYSES
+
+    analysis_class = ANALYSES[analysis]
+    workspace = tempfile.mkdtemp(prefix="dynamicslicing-benchmark-")
+    program_file = join(workspace, "program.py")
+    source = generate_program(**SIZES[size])
+    with open(program_file, "w") as file:
+        file.write(source)
+    # a cold cache, so that instrumenting is timed in full
+    os.environ[CACHE_DIR_VARIABLE] = join(workspace, "cache")
+    memory_before = peak_memory_kb()
+    timings = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        selected_hooks = get_hooks_from_analysis([f"{analysis_class.__module__}.{analysis_class.__name__}:{program_file}"])
+        instrument_file(program_file, selected_hooks, relevant_lines(source) if preslice else None)
+        timings["instrument"] = time.perf_counter() - start
+
+        instance = analysis_class(program_file + ".orig")
+        _rt.analyses = None
+        _rt.set_analysis([instance])
+        start = time.perf_counter()
+        runpy.run_path(program_file)
+        timings["execute"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        _rt.end_execution()
+        timings["end_execution"] = time.perf_counter() - start
+    # reads dropped by the read filter and events dropped as saturated were still delivered by a hook
+    events = len(instance.trace) + instance.saturated_events + instance.filtered_reads
+    shutil.rmtree(workspace)
+    return {
+        **timings,
+        "events": events,
+        "events_per_second": events / timings["execute"] if timings["execute"] > 0 else 0.0,
+        "peak_memory_kb": peak_memory_kb() - memory_before,
+    }
+
+
+def measure_in_subprocess(size: str, analysis: str, preslice: bool) -> Dict[str, Any]:
+    # a fresh interpreter per case keeps peak memory and import caches independent
+    output = subprocess.run(
+        [sys.executable, realpath(__file__), "--measure", size, analysis] + (["--preslice"] if preslice else []),
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def run(sizes: List[str], analyses: List[str], repeat: int, preslice: bool = False) -> Dict[str, Any]:
+    results = {}
+    for size in sizes:
+        for analysis in analyses:
+            runs = [measure_in_subprocess(size, analysis, preslice) for _ in range(repeat)]
+            # the median is robust to the odd run disturbed by the rest of the machine
+            typical = {phase: median(r[phase] for r in runs) for phase in PHASES}
+            events = runs[0]["events"]
+            results[f"{size}/{analysis}"] = {
+                **typical,
+                "events": events,
+                "events_per_second": events / typical["execute"] if typical["execute"] > 0 else 0.0,
+                "peak_memory_kb": median(r["peak_memory_kb"] for r in runs),
+            }
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sizes": {size: SIZES[size] for size in sizes},
+        "preslice": preslice,
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+        Returns a description of every phase time, throughput or memory figure that is worse
+        than the baseline by more than the tolerance
+    """
+    regressions = []
+    for case, result in current["results"].items():
+        reference = baseline.get("results", {}).get(case)
+        if reference is None:
+            continue
+        for phase in PHASES:
+            if result[phase] > reference[phase] * (1 + tolerance) and result[phase] - reference[phase] > NOISE_FLOOR:
+                regressions.append(f"{case} {phase}: {result[phase]:.4f}s, baseline {reference[phase]:.4f}s")
+        if result["events_per_second"] < reference["events_per_second"] / (1 + tolerance) and result["execute"] - reference["execute"] > NOISE_FLOOR:
+            regressions.append(f"{case} events/s: {result['events_per_second']:.0f}, baseline {reference['events_per_second']:.0f}")
+        if result["peak_memory_kb"] > max(reference["peak_memory_kb"], 1024) * (1 + tolerance):
+            regressions.append(f"{case} peak memory: {result['peak_memory_kb']} KiB, baseline {reference['peak_memory_kb']} KiB")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark instrumentation, execution and slicing on generated programs")
+    parser.add_argument("--sizes", nargs="+", choices=sorted(SIZES), default=["small", "medium"])
+    parser.add_argument("--analyses", nargs="+", choices=["full", "dataflow"], default=["full", "dataflow"])
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case, the median is reported")
+    parser.add_argument("--preslice", action="store_true", help="Instrument only the static pre-slice of the criterion")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Baseline report to compare against")
+    parser.add_argument("--update-baseline", action="store_true", help="Store this report as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before a case counts as a regression")
+    parser.add_argument("--measure", nargs=2, metavar=("SIZE", "ANALYSIS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(*args.measure, preslice=args.preslice)))
+        return 0
+
+    report = run(args.sizes, args.analyses, args.repeat, args.preslice)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+    if args.update_baseline:
+        with open(args.baseline, "w") as file:
+            file.write(text + "\n")
+        return 0
+    if not os.path.exists(args.baseline):
+        return 0
+    with open(args.baseline, "r") as file:
+        regressions = compare(report, json.load(file), args.tolerance)
+    for regression in regressions:
+        print(f"regression: {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+from collections import OrderedDict
+from contextlib import redirect_stdout
+from pathlib import Path
+from types import CodeType
+from typing import Any, Dict, FrozenSet, NamedTuple, Optional, Set, Tuple
+import io
+import os
+import tempfile
+import threading
+from dynapyt.instrument.IIDs import Location
+from dynapyt.utils.hooks import get_hooks_from_analysis
+from dynamicslicing.instrument_cache import instrument_source
+from dynamicslicing.offline import ANALYSES, OfflineSlicer, RecordTrace
+from dynamicslicing.preslice import relevant_lines
+from dynamicslicing.shadow import DefUseSlice, ForwardSlice
+from dynamicslicing.utils import MAX_CACHED_MODULES, iid_index, slicing_criterion, source_hash
+
+# name the instrumented code is compiled under; no such file is ever written
+MEMORY_FILE = os.path.join(tempfile.gettempdir(), "dynamicslicing-memory.py")
+MEMORY_DYN_AST = str(Path(MEMORY_FILE).resolve()) + ".orig"
+
+# the dynapyt runtime holds the running analyses in module state, so runs take turns
+_runtime_lock = threading.Lock()
+_instrumented = OrderedDict()
+
+# analyses that slice while the program runs; "shadow" resolves its dependences as they happen
+# and "forward" keeps no trace at all, so neither can be replayed offline
+LIVE_ANALYSES = {**ANALYSES, "shadow": DefUseSlice, "forward": ForwardSlice}
+
+
+class SourceSlice(NamedTuple):
+    # lines kept in the slice, and the variables the criterion transitively depends on
+    lines: FrozenSet[int]
+    criteria: FrozenSet[str]
+    sliced: str
+    output: str
+
+
+class MemoryIIDs:
+    """
+        Hands out iids like dynapyt's IIDs, without a json file behind them
+    """
+    def __init__(self) -> None:
+        self.iid_to_location: Dict[int, Location] = {}
+        self.location_to_iid: Dict[Location, int] = {}
+
+    def new(self, file: str, start_line: int, start_column: int, end_line: int, end_column: int) -> int:
+        location = Location(file, start_line, start_column, end_line, end_column)
+        iid = self.location_to_iid.get(location)
+        if iid is None:
+            iid = self.location_to_iid[location] = len(self.iid_to_location)
+            self.iid_to_location[iid] = location
+        return iid
+
+
+def instrumented(
+    source: str, analysis: str, instance, selected_lines: Optional[Set[int]] = None
+) -> Tuple[CodeType, Dict[int, Location]]:
+    """
+        Returns the compiled instrumented program and its iid locations, instrumenting only the
+        first time a source is sliced with an analysis and the same selected lines
+    """
+    key = (source_hash(source), analysis, None if selected_lines is None else frozenset(selected_lines))
+    cached = _instrumented.get(key)
+    if cached is None:
+        iids = MemoryIIDs()
+        code = instrument_source(source, MEMORY_FILE, iids, get_hooks_from_analysis([instance]), selected_lines)
+        if code is None:
+            raise ValueError("the source cannot be instrumented")
+        cached = _instrumented[key] = (compile(code, MEMORY_FILE, "exec"), iids.iid_to_location)
+        if len(_instrumented) > MAX_CACHED_MODULES:
+            _instrumented.popitem(last=False)
+    else:
+        _instrumented.move_to_end(key)
+    return cached
+
+
+def source_criterion(source: str) -> Tuple[int, Set[str]]:
+    """
+        Returns the (line, variables) criterion of the "# slicing criterion" comment of source
+    """
+    variables, line = slicing_criterion(source)
+    if line is None:
+        raise ValueError("no slicing criterion: mark a line with '# slicing criterion' or pass criterion=(line, variables)")
+    return line, variables
+
+
+def prepare(
+    source: str, criterion: Optional[Tuple[int, Optional[Set[str]]]] = None, analysis: str = "full", preslice: bool = False
+) -> Tuple[Any, CodeType]:
+    """
+        Returns a slicer for source with its iid index, and the compiled instrumented program,
+        without running anything. With preslice, only the static pre-slice of the criterion gets data hooks
+    """
+    if criterion is None:
+        criterion = source_criterion(source)
+    slicer = LIVE_ANALYSES[analysis](MEMORY_DYN_AST, criterion=criterion, code=source)
+    code, locations = instrumented(source, analysis, slicer, relevant_lines(source, criterion) if preslice else None)
+    slicer.iid_indices[MEMORY_DYN_AST] = iid_index(source, locations)
+    return slicer, code
+
+
+def run(slicer: Any, code: CodeType) -> SourceSlice:
+    """
+        Executes a prepared program under its slicer and slices it
+    """
+    import dynapyt.runtime as _rt
+
+    with _runtime_lock:
+        output = io.StringIO()
+        # set directly: set_analysis would register signal and exit handlers that call end_execution
+        previous, _rt.analyses = _rt.analyses, [slicer]
+        try:
+            with redirect_stdout(output):
+                exec(code, {"__name__": "__main__", "__file__": MEMORY_FILE})
+        finally:
+            _rt.analyses = previous
+        sliced = slicer.slice_code()
+    return SourceSlice(frozenset(slicer.line_numbers), frozenset(slicer.slice_criteria), sliced, output.getvalue())
+
+
+def run_monitored(source: str, criterion: Optional[Tuple[int, Optional[Set[str]]]] = None, analysis: str = "full") -> SourceSlice:
+    """
+        Runs the unmodified source under sys.monitoring (Python 3.12+) and slices the recorded trace
+    """
+    from dynamicslicing.monitoring import MonitoringRecorder, check_available
+
+    check_available()
+    if analysis not in ANALYSES:
+        raise ValueError(f"the monitoring backend cannot run the {analysis!r} analysis")
+    if criterion is None:
+        criterion = source_criterion(source)
+    # the iids still come from dynapyt, so that both backends record the same events
+    recorder = MonitoringRecorder(source, MEMORY_DYN_AST, instrumented(source, "record", RecordTrace(MEMORY_DYN_AST))[1])
+    output = io.StringIO()
+    with redirect_stdout(output):
+        recorder.run(compile(source, MEMORY_FILE, "exec"), {"__name__": "__main__", "__file__": MEMORY_FILE})
+    slicer = OfflineSlicer.from_trace(recorder.trace, recorder.metadata()).analysis(criterion[0], criterion[1], analysis)
+    sliced = slicer.slice_code()
+    return SourceSlice(frozenset(slicer.line_numbers), frozenset(slicer.slice_criteria), sliced, output.getvalue())
+
+
+def slice_source(
+    source: str,
+    criterion: Optional[Tuple[int, Optional[Set[str]]]] = None,
+    analysis: str = "full",
+    backend: str = "dynapyt",
+    preslice: bool = False,
+) -> SourceSlice:
+    """
+        Runs source and slices it for criterion, a (line, variables) tuple where variables None means
+        the ones used on the line, or for its "# slicing criterion" comment, with the "full", "dataflow",
+        "shadow" or "forward" analysis. Nothing is read from
+        or written to disk, and what the program prints is returned instead of printed.
+        backend="monitoring" runs the program unmodified under sys.monitoring instead of dynapyt's hooks.
+        preslice=True adds dynapyt's data hooks to the static pre-slice of the criterion only
+    """
+    if backend == "monitoring":
+        return run_monitored(source, criterion, analysis)
+    if backend != "dynapyt":
+        raise ValueError(f"unknown backend {backend!r}, expected 'dynapyt' or 'monitoring'")
+    return run(*prepare(source, criterion, analysis, preslice))
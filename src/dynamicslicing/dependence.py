@@ -0,0 +1,350 @@
+from array import array
+from bisect import bisect_left
+from typing import Any, Callable, Dict, FrozenSet, Iterable, NamedTuple, Optional, Sequence, Set, Tuple
+import libcst as cst
+import libcst.matchers as m
+from dynamicslicing.trace import TraceRecorder, NO_ID, READ, FUNCTION_ENTER, FUNCTION_EXIT, BRANCH_TAKEN, BRANCH_NOT_TAKEN
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# frontiers smaller than this are expanded node by node, where numpy's per-call overhead would dominate
+VECTOR_FRONTIER = 256
+
+
+class CsrGraph(NamedTuple):
+    # node i stands for events[i] on lines[i], and depends on the nodes indices[indptr[i]:indptr[i + 1]]
+    events: array
+    lines: array
+    indptr: array
+    indices: array
+
+    def arrays(self) -> Tuple[Any, ...]:
+        """
+            Returns the four columns as numpy arrays that share their memory
+        """
+        return tuple(numpy.frombuffer(column, dtype=numpy.int64) for column in self)
+
+
+def csr_reachable(csr: CsrGraph, starts: Iterable[int]) -> Sequence[int]:
+    """
+        Returns the sorted nodes reachable from starts with a level-by-level breadth-first search,
+        as a numpy array when numpy is installed. Wide frontiers are then expanded at once
+    """
+    visited = bytearray(len(csr.events))
+    frontier = []
+    for node in starts:
+        if not visited[node]:
+            visited[node] = 1
+            frontier.append(node)
+    indptr, indices = csr.indptr, csr.indices
+    if numpy is not None:
+        seen = numpy.frombuffer(visited, dtype=bool)
+        _, _, vector_indptr, vector_indices = csr.arrays()
+    while len(frontier):
+        if numpy is not None and len(frontier) >= VECTOR_FRONTIER:
+            nodes = numpy.asarray(frontier, dtype=numpy.int64)
+            begins = vector_indptr[nodes]
+            counts = vector_indptr[nodes + 1] - begins
+            # the positions of every successor of the frontier, gathered into one index array
+            positions = numpy.repeat(begins - numpy.cumsum(counts) + counts, counts) + numpy.arange(counts.sum())
+            successors = vector_indices[positions]
+            frontier = numpy.sort(successors[~seen[successors]])
+            if len(frontier):
+                # drop repeats, cheaper than numpy.unique on sorted input
+                frontier = frontier[numpy.concatenate(([True], frontier[1:] != frontier[:-1]))]
+            seen[frontier] = True
+            if len(frontier) < VECTOR_FRONTIER:
+                frontier = frontier.tolist()
+            continue
+        expanded = []
+        for node in frontier:
+            for successor in indices[indptr[node]:indptr[node + 1]]:
+                if not visited[successor]:
+                    visited[successor] = 1
+                    expanded.append(successor)
+        frontier = expanded
+    if numpy is not None:
+        return numpy.flatnonzero(seen)
+    return [node for node, reached in enumerate(visited) if reached]
+
+
+def plain_name(node: Optional[cst.CSTNode]) -> Optional[str]:
+    value = getattr(node, "value", None)
+    return value if isinstance(value, str) else None
+
+
+def base_name(node: cst.CSTNode) -> Optional[str]:
+    # ages[-1] and p.name stand for the ages and p objects
+    while isinstance(node, (cst.Attribute, cst.Subscript)):
+        node = node.value
+    return plain_name(node)
+
+
+def dependence_names(node: cst.CSTNode) -> Tuple[FrozenSet[str], FrozenSet[str]]:
+    """
+        Returns the defined and used names of a recorded node, with the name-based rules the
+        analyses have always used for assignments, augmented assignments and list appends, and
+        the names an if or while condition or an f-string reads
+    """
+    defs, uses = set(), set()
+    if isinstance(node, cst.Assign):
+        target = node.targets[0].target
+        base = plain_name(target.value) if isinstance(target, (cst.Attribute, cst.Subscript)) else None
+        if isinstance(node.value, cst.Comparison):
+            defs.add(plain_name(target))
+        elif base is not None and plain_name(getattr(node.value, "value", None)) is not None:
+            # p.name = q.name / ages[0] = other[1]: the object depends on the one it copies from
+            defs.add(base)
+            uses.add(plain_name(node.value.value))
+        elif isinstance(target, cst.Attribute):
+            defs.add(target.attr.value)
+        else:
+            defs.add(plain_name(target))
+        if base is not None:
+            # p.name = "Undefined" / ages[0] = 5: the rest of the object is the one it updates
+            defs.add(base)
+            uses.add(base)
+    elif isinstance(node, cst.AugAssign):
+        # total += i and ages[-1] += 50 read the object they update
+        defs.add(base_name(node.target))
+        uses.add(base_name(node.target))
+    elif isinstance(node, (cst.If, cst.While)):
+        uses.update(name.value for name in m.findall(node.test, m.Name()))
+    elif isinstance(node, cst.Call):
+        if isinstance(node.func, cst.Attribute) and node.func.attr.value == "append" and len(node.args) > 0:
+            defs.add(plain_name(node.func.value))
+            uses.add(plain_name(node.args[0].value))
+    value = getattr(node, "value", None)
+    if isinstance(value, cst.BinaryOperation):
+        uses.update((plain_name(value.left), plain_name(value.right)))
+    elif isinstance(value, cst.Name):
+        uses.add(value.value)
+    elif isinstance(value, cst.Subscript):
+        # first = values[0]: an element copied out of a container depends on the container
+        uses.add(plain_name(value.value))
+    elif isinstance(value, cst.FormattedString):
+        uses.update(base_name(part.expression) for part in value.parts if isinstance(part, cst.FormattedStringExpression))
+    defs.discard(None)
+    uses.discard(None)
+    return frozenset(defs), frozenset(uses)
+
+
+class DependenceBuilder:
+    """
+        Resolves the dependences of events in program order: an event depends on the last events
+        that defined the names it uses and, when the enclosing if or while header of every line is
+        known, on the last evaluation of the header that decided whether it runs. The nodes and
+        edges go straight into CSR arrays, and nodes are referred to by their position in them
+    """
+    def __init__(self, enclosing: Optional[Callable[[str, int], Optional[int]]] = None) -> None:
+        self.enclosing = enclosing
+        self.events, self.lines = array("q"), array("q")
+        self.indptr, self.indices = array("q", [0]), array("q")
+        self.names: Dict[cst.CSTNode, Tuple[FrozenSet[str], FrozenSet[str]]] = {}
+        # name -> its last definition, and the positions of all its definitions in order
+        self.definers: Dict[str, int] = {}
+        self.definitions: Dict[str, array] = {}
+        # (line, name) -> the definitions the reads of name on line saw, without consecutive repeats
+        self.reads: Dict[Tuple[int, str], array] = {}
+        # (call depth, file, header line) -> last evaluation of the header at that depth
+        self.branches: Dict[Tuple[int, str, int], int] = {}
+        self.depth = 0
+
+    def node_names(self, node: cst.CSTNode) -> Tuple[FrozenSet[str], FrozenSet[str]]:
+        names = self.names.get(node)
+        if names is None:
+            names = self.names[node] = dependence_names(node)
+        return names
+
+    def enter(self) -> None:
+        self.depth += 1
+
+    def leave(self) -> None:
+        if self.depth:
+            self.depth -= 1
+
+    def dependences(self, file: str, line: int, node: cst.CSTNode) -> Tuple[int, ...]:
+        """
+            Returns the nodes an event of node on line would depend on now
+        """
+        definers = self.definers
+        dependences = {definers[name] for name in self.node_names(node)[1] if name in definers}
+        if self.enclosing is not None:
+            header = self.enclosing(file, line)
+            branch = None if header is None else self.branches.get((self.depth, file, header))
+            if branch is not None:
+                dependences.add(branch)
+        return tuple(dependences)
+
+    def read(self, line: int, name: Optional[str]) -> None:
+        """
+            Notes the definition a read of name on line sees, the one a criterion on line starts from
+        """
+        definer = self.definers.get(name)
+        if definer is None:
+            return
+        reads = self.reads.get((line, name))
+        if reads is None:
+            reads = self.reads[(line, name)] = array("q")
+        if not reads or reads[-1] != definer:
+            reads.append(definer)
+
+    def define(self, position: int, kind: int, file: str, line: int, node: cst.CSTNode) -> None:
+        """
+            Makes the node at position the last definition of the names node defines, or the last
+            evaluation of its header
+        """
+        for name in self.node_names(node)[0]:
+            self.definers[name] = position
+            definitions = self.definitions.get(name)
+            if definitions is None:
+                definitions = self.definitions[name] = array("q")
+            if not definitions or definitions[-1] != position:
+                definitions.append(position)
+        if kind == BRANCH_TAKEN or kind == BRANCH_NOT_TAKEN:
+            self.branches[(self.depth, file, line)] = position
+
+    def add(
+        self, event: int, kind: int, file: str, line: int, node: cst.CSTNode, dependences: Optional[Tuple[int, ...]] = None
+    ) -> int:
+        """
+            Appends a node for event and returns its position
+        """
+        if dependences is None:
+            dependences = self.dependences(file, line, node)
+        position = len(self.events)
+        self.events.append(event)
+        self.lines.append(line)
+        self.indices.extend(dependences)
+        self.indptr.append(len(self.indices))
+        self.define(position, kind, file, line, node)
+        return position
+
+    def graph(self, event_node: Optional[Callable[[int], cst.CSTNode]] = None) -> "DependenceGraph":
+        csr = CsrGraph(self.events, self.lines, self.indptr, self.indices)
+        names = None if event_node is None else lambda event: self.node_names(event_node(event))
+        return DependenceGraph(csr, self.definitions, self.reads, names)
+
+
+class DependenceGraph:
+    """
+        Dynamic dependence graph over recorded events, one node per execution, held as CSR arrays
+        ordered by event. An event depends on the events that last defined the names it uses
+        when it ran, and on the last evaluation of its enclosing if or while header
+    """
+    def __init__(
+        self,
+        csr: CsrGraph,
+        definitions: Optional[Dict[str, array]] = None,
+        reads: Optional[Dict[Tuple[int, str], array]] = None,
+        names: Optional[Callable[[int], Tuple[FrozenSet[str], FrozenSet[str]]]] = None,
+    ) -> None:
+        self.csr = csr
+        self.definitions: Dict[str, array] = {} if definitions is None else definitions
+        self.reads: Dict[Tuple[int, str], array] = {} if reads is None else reads
+        self.names = names
+
+    @classmethod
+    def from_trace(
+        cls,
+        trace: TraceRecorder,
+        iid_entry: Callable[[str, int], Any],
+        enclosing: Optional[Callable[[str, int], Optional[int]]] = None,
+    ) -> "DependenceGraph":
+        """
+            Builds the graph of a complete trace in one pass over its chunks, with control
+            dependences when enclosing maps a file and line to its enclosing header line
+        """
+        builder = DependenceBuilder(enclosing)
+        for first, (kinds, iids, lines, _frames, names, files) in trace.chunks():
+            for offset, kind in enumerate(kinds):
+                if kind == READ:
+                    if names[offset] != NO_ID:
+                        builder.read(lines[offset], trace.name_table[names[offset]])
+                elif kind == FUNCTION_EXIT:
+                    builder.leave()
+                else:
+                    file = trace.file_table[files[offset]]
+                    builder.add(first + offset, kind, file, lines[offset], iid_entry(file, iids[offset]).node)
+                    if kind == FUNCTION_ENTER:
+                        builder.enter()
+        return builder.graph(lambda event: iid_entry(trace.file(event), trace.iid(event)).node)
+
+    @classmethod
+    def from_edges(cls, lines: Dict[int, int], edges: Dict[int, Tuple[int, ...]]) -> "DependenceGraph":
+        """
+            Builds the graph of the events in lines, each depending on the events edges lists for it
+        """
+        events = sorted(lines)
+        positions = {event: position for position, event in enumerate(events)}
+        indptr, indices = array("q", [0]), array("q")
+        for event in events:
+            indices.extend(positions[successor] for successor in edges.get(event, ()))
+            indptr.append(len(indices))
+        return cls(CsrGraph(array("q", events), array("q", (lines[event] for event in events)), indptr, indices))
+
+    @classmethod
+    def from_def_use(cls, trace: TraceRecorder, uses: Dict[int, Tuple[int, ...]]) -> "DependenceGraph":
+        """
+            Builds the graph from def-use edges resolved while the program ran, one node per event
+        """
+        events = set(uses)
+        for writers in uses.values():
+            events.update(writers)
+        return cls.from_edges({event: trace.line(event) for event in events}, uses)
+
+    def position(self, event: int) -> int:
+        return bisect_left(self.csr.events, event)
+
+    def successors(self, event: int) -> Tuple[int, ...]:
+        csr, position = self.csr, self.position(event)
+        return tuple(csr.events[node] for node in csr.indices[csr.indptr[position]:csr.indptr[position + 1]])
+
+    def to_csr(self) -> CsrGraph:
+        return self.csr
+
+    def reachable_nodes(self, nodes: Iterable[int]) -> Set[int]:
+        """
+            Returns the events of every node the given nodes transitively depend on, including themselves
+        """
+        found = csr_reachable(self.csr, nodes)
+        if numpy is not None:
+            return set(self.csr.arrays()[0][found].tolist())
+        return {self.csr.events[node] for node in found}
+
+    def reachable(self, events: Iterable[int]) -> Set[int]:
+        """
+            Returns every event the given events transitively depend on, including themselves
+        """
+        return self.reachable_nodes(self.position(event) for event in events)
+
+    def reachable_lines(self, events: Iterable[int]) -> Set[int]:
+        """
+            Returns the lines of every event the given events transitively depend on
+        """
+        csr = self.csr
+        nodes = csr_reachable(csr, (self.position(event) for event in events))
+        if numpy is not None:
+            # lines are small ints, so counting them is cheaper than sorting them
+            return set(numpy.flatnonzero(numpy.bincount(csr.arrays()[1][nodes])).tolist())
+        return {csr.lines[node] for node in nodes}
+
+    def backward_slice(self, names: Set[str], line: int) -> Set[int]:
+        """
+            Returns the events the criterion names on line depend on: everything reachable from the
+            definitions its reads of names saw, and from its own definitions of names
+        """
+        lines = self.csr.lines
+        seeds = [node for name in names for node in self.reads.get((line, name), ())]
+        seeds.extend(node for name in names for node in self.definitions.get(name, ()) if lines[node] == line)
+        return self.reachable_nodes(seeds)
+
+    def used_names(self, events: Iterable[int]) -> Set[str]:
+        names = set()
+        for event in events:
+            names.update(self.names(event)[1])
+        return names
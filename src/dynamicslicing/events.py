@@ -0,0 +1,282 @@
+from array import array
+from bisect import bisect_right
+from heapq import heappop, heappush
+import libcst as cst
+from dynamicslicing.dependence import DependenceBuilder, DependenceGraph
+from dynamicslicing.trace import EventRing, TraceRecorder, EVENT_KINDS, NO_ID, READ, WRITE, PRE_CALL, POST_CALL, FUNCTION_ENTER, FUNCTION_EXIT, BRANCH_TAKEN, BRANCH_NOT_TAKEN
+from dynamicslicing.instrument_cache import iid_locations
+from dynamicslicing.profiling import profiler_for
+from dynamicslicing.utils import IidEntry, iid_index, program_structure
+from typing import List, Callable, Any, Tuple, Dict, Optional, Set
+import os
+
+
+# (file, iid, kind) of a hook -> its events, in trace order
+Hooks = Dict[Tuple[str, int, int], array]
+
+
+class TraceIndex:
+    """
+        The events of a trace grouped by what the on_* handlers look at: writes and calls by the
+        name they write or call, reads by line and name, and function entries and calls without
+        arguments, which every criterion handles alike. The handlers only add to sets, so once a
+        name is relevant only the first later event of each of its hooks needs to run
+    """
+    def __init__(self, trace: TraceRecorder, iid_entry: Callable[[str, int], IidEntry]) -> None:
+        self.names: Dict[str, Hooks] = {}
+        self.reads: Dict[Tuple[int, str], Hooks] = {}
+        self.always: Hooks = {}
+        # (file, iid) -> [taken, not taken] counts of the recorded conditions
+        self.branches: Dict[Tuple[str, int], List[int]] = {}
+        for first, (kinds, iids, lines, _frames, _names, files) in trace.chunks():
+            for offset, kind in enumerate(kinds):
+                file, iid = trace.file_table[files[offset]], iids[offset]
+                if kind == BRANCH_TAKEN or kind == BRANCH_NOT_TAKEN:
+                    self.branches.setdefault((file, iid), [0, 0])[kind == BRANCH_NOT_TAKEN] += 1
+                    continue
+                entry = iid_entry(file, iid)
+                if kind == FUNCTION_ENTER or (kind == PRE_CALL and len(entry.node.args) == 0):
+                    self.always.setdefault((file, iid, kind), array("q", [first + offset]))
+                    continue
+                if entry.name is None or kind == FUNCTION_EXIT:
+                    continue
+                hooks = self.reads.setdefault((lines[offset], entry.name), {}) if kind == READ else self.names.setdefault(entry.name, {})
+                hooks.setdefault((file, iid, kind), array("q")).append(first + offset)
+
+
+class EventProcessing:
+    """
+        Hooks and event processing shared by the live analyses: the hooks only buffer raw events,
+        which are recorded in the trace and fed to the analysis' on_* handlers in batches. A mixin
+        rather than an analysis, so that only its subclasses are picked up as analyses
+    """
+    # whether the dependence graph has edges from events to the if and while headers around them
+    control_dependences = False
+
+    def __init__(self, source, criterion: Optional[Tuple[int, Optional[Set[str]]]] = None, code: Optional[str] = None):
+        super().__init__()
+        self.args = source
+        # an explicit (line, variables) criterion replaces the "# slicing criterion" comment
+        self.criterion = criterion
+        self.source = code
+        self.initialize_slice_data()
+        self.profiler = profiler_for(self)
+
+    def initialize_slice_data(self):
+        self.read_source_file()
+        self.extract_slice_criteria()
+
+    def read_source_file(self):
+        if self.source is not None:
+            return
+        file_name = f"{self.args}"
+        with open(file_name, "r") as file:
+            self.source = file.read()
+
+    def initialize_events(self) -> None:
+        self.dependence_graph = None
+        self.iid_indices = {}
+        self.read_filters = {}
+        self.sources = {}
+        self.saturation = {}
+        self.builder = DependenceBuilder(self.enclosing_header if self.control_dependences else None)
+        # dependence node -> bit set of the iid hooks it transitively depends on, including its own
+        self.reached: List[int] = []
+        self.key_bits = {}
+        self.last_nodes = {}
+        self.saturated_events = 0
+        self.filtered_reads = 0
+        self.ring = EventRing()
+        self.trace = TraceRecorder()
+        self.frames = [NO_ID]
+
+    def iid_entries(self, dyn_ast: str) -> List[Optional[IidEntry]]:
+        index = self.iid_indices.get(dyn_ast)
+        if index is None:
+            with open(dyn_ast, "r") as file:
+                self.sources[dyn_ast] = file.read()
+            index = self.iid_indices[dyn_ast] = iid_index(self.sources[dyn_ast], iid_locations(dyn_ast))
+        return index
+
+    def enclosing_header(self, dyn_ast: str, line: int) -> Optional[int]:
+        # an index handed in through iid_indices is the sliced source's
+        return program_structure(self.sources.get(dyn_ast, self.source)).branch_headers.get(line)
+
+    def iid_entry(self, dyn_ast: str, iid: int) -> IidEntry:
+        return self.iid_entries(dyn_ast)[iid]
+
+    def read_filter(self, dyn_ast: str) -> bytearray:
+        """
+            Returns a per-iid table marking the reads that can matter, the ones on the criterion line
+        """
+        read_filter = bytearray(
+            entry is not None and entry.line == self.slicing_criterion_location for entry in self.iid_entries(dyn_ast)
+        )
+        self.read_filters[dyn_ast] = read_filter
+        return read_filter
+
+    def record(self, kind: int, dyn_ast: str, iid: int, entry: IidEntry) -> int:
+        return self.trace.append(kind, iid, entry.line, self.frames[-1], entry.name, dyn_ast)
+
+    def handlers(self) -> Tuple[Optional[Callable[[IidEntry, int], None]], ...]:
+        # handler of every event kind, by kind; branch outcomes are counted where they are recorded
+        return (self.on_read, self.on_write, self.on_pre_call, self.on_post_call, self.on_function_enter, None, None, None)
+
+    def process(self, kind: int, dyn_ast: str, iid: int, handler: Optional[Callable[[IidEntry, int], None]]) -> Optional[int]:
+        """
+            Records an event and runs its handler, unless its iid is saturated: its handler last ran
+            without changing the state, nothing changed since, and the event would depend on the
+            same iids as the last recorded event of its iid. Such an event cannot change the slice,
+            so it is dropped, and the definitions it would make point to that last event instead
+        """
+        saturation = self.saturation.get(dyn_ast)
+        if saturation is None:
+            saturation = self.saturation[dyn_ast] = {}
+        # pre_call and post_call share their iid, so saturation is tracked per hook
+        key = iid * len(EVENT_KINDS) + kind
+        state = self.state()
+        entry = self.iid_entry(dyn_ast, iid)
+        saturated = saturation.get(key) == state
+        if kind == READ:
+            # even a dropped read may see a definition the criterion starts from
+            self.builder.read(entry.line, entry.name)
+        # reads and exits are not part of the dependence graph
+        if kind == READ or kind == FUNCTION_EXIT:
+            if saturated:
+                self.saturated_events += 1
+                return None
+            event = self.record(kind, dyn_ast, iid, entry)
+        else:
+            builder, reached = self.builder, self.reached
+            dependences = builder.dependences(dyn_ast, entry.line, entry.node)
+            bit = self.key_bits.get((dyn_ast, key))
+            if bit is None:
+                bit = self.key_bits[(dyn_ast, key)] = 1 << len(self.key_bits)
+            reaches = bit
+            for dependence in dependences:
+                reaches |= reached[dependence]
+            last = self.last_nodes.get((dyn_ast, key))
+            if saturated and last is not None and reached[last] == reaches:
+                builder.define(last, kind, dyn_ast, entry.line, entry.node)
+                self.saturated_events += 1
+                return None
+            event = self.record(kind, dyn_ast, iid, entry)
+            reached.append(reaches)
+            self.last_nodes[(dyn_ast, key)] = builder.add(event, kind, dyn_ast, entry.line, entry.node, dependences)
+        if handler is not None:
+            handler(entry, event)
+        saturation[key] = state if self.state() == state else None
+        return event
+
+    def drain(self) -> None:
+        """
+            Processes the buffered hook events in program order and empties the buffer
+        """
+        if self.ring.size == 0:
+            return
+        with self.profiler.phase("process events"):
+            handlers = self.handlers()
+            process, frames, builder = self.process, self.frames, self.builder
+            for kind, iid, dyn_ast in self.ring.events():
+                event = process(kind, dyn_ast, iid, handlers[kind])
+                if kind == FUNCTION_ENTER:
+                    frames.append(frames[-1] if event is None else event)
+                    builder.enter()
+                elif kind == FUNCTION_EXIT:
+                    builder.leave()
+                    if len(frames) > 1:
+                        frames.pop()
+            self.ring.clear()
+
+    def event_node(self, event: int) -> cst.CSTNode:
+        return self.iid_entry(self.trace.file(event), self.trace.iid(event)).node
+
+    def replay(self, trace: TraceRecorder, index: Optional[TraceIndex] = None) -> None:
+        """
+            Feeds a recorded trace through the event handlers instead of running the program. Only
+            the hooks of the names the criterion makes relevant run, in trace order, and a name
+            made relevant along the way only brings in the events after the one that added it
+        """
+        self.trace = trace
+        if index is None:
+            index = TraceIndex(trace, self.iid_entry)
+        if self.dependence_graph is None:
+            enclosing = self.enclosing_header if self.control_dependences else None
+            self.dependence_graph = DependenceGraph.from_trace(trace, self.iid_entry, enclosing)
+        handlers = self.handlers()
+        pending: List[Tuple[int, int, str, int]] = []
+
+        def activate(hooks: Hooks, after: int) -> None:
+            for (file, iid, kind), events in hooks.items():
+                position = bisect_right(events, after)
+                if position < len(events):
+                    heappush(pending, (events[position], kind, file, iid))
+
+        activate(index.always, NO_ID)
+        active: Set[str] = set()
+        event = NO_ID
+        while True:
+            # the criteria only grow, so a size change means new names
+            if len(active) != len(self.slice_criteria):
+                for name in self.slice_criteria - active:
+                    active.add(name)
+                    activate(index.names.get(name, {}), event)
+                    activate(index.reads.get((self.slicing_criterion_location, name), {}), event)
+            if not pending:
+                break
+            event, kind, file, iid = heappop(pending)
+            handler = handlers[kind]
+            if handler is not None:
+                handler(self.iid_entry(file, iid), event)
+
+    def read(self, dyn_ast: str, iid: int, val: Any) -> Any:
+        read_filter = self.read_filters.get(dyn_ast)
+        if read_filter is None:
+            read_filter = self.read_filter(dyn_ast)
+        if not read_filter[iid]:
+            self.filtered_reads += 1
+            return
+        if self.ring.push(READ, iid, dyn_ast):
+            self.drain()
+
+    def write(
+        self, dyn_ast: str, iid: int, old_vals: List[Callable], new_val: Any
+    ) -> Any:
+        if self.ring.push(WRITE, iid, dyn_ast):
+            self.drain()
+
+    def post_call(
+        self,
+        dyn_ast: str,
+        iid: int,
+        result: Any,
+        call: Callable,
+        pos_args: Tuple,
+        kw_args: Dict,
+    ) -> Any:
+        if self.ring.push(POST_CALL, iid, dyn_ast):
+            self.drain()
+
+    def function_enter(
+        self, dyn_ast: str, iid: int, args: List[Any], name: str, is_lambda: bool
+    ) -> None:
+        if self.ring.push(FUNCTION_ENTER, iid, dyn_ast):
+            self.drain()
+
+    def function_exit(
+        self, dyn_ast: str, iid: int, function_name: str, result: Any
+    ) -> Any:
+        if self.ring.push(FUNCTION_EXIT, iid, dyn_ast):
+            self.drain()
+
+    def pre_call(
+        self, dyn_ast: str, iid: int, function: Callable, pos_args: Tuple, kw_args: Dict
+    ):
+        if self.ring.push(PRE_CALL, iid, dyn_ast):
+            self.drain()
+
+    def end_execution(self) -> None:
+        sliced_code = self.slice_code()
+        output_file_name = os.path.join(os.path.dirname(self.args), "sliced.py")
+        with open(output_file_name, "w") as output_file:
+            output_file.write(sliced_code)
@@ -0,0 +1,113 @@
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import runpy
+import sys
+import tempfile
+import time
+import traceback
+from shutil import copyfile
+from typing import Iterable, List, NamedTuple, Optional, Set, Tuple
+
+# imported once by the fork server, so that workers start with them loaded
+PRELOAD = ["dynapyt.runtime", "dynamicslicing.offline", "dynamicslicing.instrument_cache", "dynamicslicing.preslice"]
+
+
+class SliceJob(NamedTuple):
+    program: str
+    analysis: str = "full"
+    criterion: Optional[Tuple[int, Optional[Set[str]]]] = None
+    preslice: bool = False
+
+
+class SliceResult(NamedTuple):
+    program: str
+    sliced: Optional[str]
+    output: str
+    error: Optional[str]
+    seconds: float
+
+
+def slice_program(job: SliceJob) -> SliceResult:
+    """
+        Instruments, runs and slices a copy of one program in a private temporary directory, with
+        the program's own directory on sys.path for its sibling imports.
+        Meant to run in a worker process of its own, see run_jobs
+    """
+    import dynapyt.runtime as _rt
+    from dynapyt.utils.hooks import get_hooks_from_analysis
+    from dynamicslicing.instrument_cache import instrument_file
+    from dynamicslicing.offline import ANALYSES
+    from dynamicslicing.preslice import relevant_lines
+
+    start = time.perf_counter()
+    output = io.StringIO()
+    try:
+        analysis_class = ANALYSES[job.analysis]
+        with tempfile.TemporaryDirectory(prefix="dynamicslicing-") as workspace:
+            program_file = os.path.join(workspace, os.path.basename(job.program))
+            copyfile(job.program, program_file)
+            # siblings are imported from where they are, without leaving bytecode next to them
+            sys.path.insert(0, os.path.dirname(os.path.abspath(job.program)))
+            sys.dont_write_bytecode = True
+            with contextlib.redirect_stdout(output):
+                selected_hooks = get_hooks_from_analysis([f"{analysis_class.__module__}.{analysis_class.__name__}:{program_file}"])
+                selected_lines = None
+                if job.preslice:
+                    with open(program_file, "r") as file:
+                        selected_lines = relevant_lines(file.read(), job.criterion)
+                instrument_file(program_file, selected_hooks, selected_lines)
+                _rt.analyses = None
+                _rt.set_analysis([analysis_class(program_file + ".orig", criterion=job.criterion)])
+                runpy.run_path(program_file)
+                _rt.end_execution()
+            with open(os.path.join(workspace, "sliced.py"), "r") as file:
+                sliced = file.read()
+        return SliceResult(job.program, sliced, output.getvalue(), None, time.perf_counter() - start)
+    except Exception:
+        return SliceResult(job.program, None, output.getvalue(), traceback.format_exc(), time.perf_counter() - start)
+
+
+def pool_context() -> multiprocessing.context.BaseContext:
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(PRELOAD)
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def run_jobs(jobs: Iterable[SliceJob], processes: Optional[int] = None) -> List[SliceResult]:
+    """
+        Runs every job in a fresh worker process, up to processes at a time (one per CPU by
+        default), and returns the results in job order
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return []
+    # one job per worker: the dynapyt runtime is module state that a run leaves behind
+    with pool_context().Pool(processes, maxtasksperchild=1) as pool:
+        return pool.map(slice_program, jobs, chunksize=1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Slice many programs in parallel, each in its own process and workspace")
+    parser.add_argument("programs", nargs="+", help="Programs with a '# slicing criterion' comment")
+    parser.add_argument("--analysis", choices=["full", "dataflow"], default="full")
+    parser.add_argument("--preslice", action="store_true", help="Instrument only the static pre-slice of the criterion")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--output-dir", help="Write <program>-sliced.py files here instead of printing the slices")
+    args = parser.parse_args()
+    failed = 0
+    for result in run_jobs([SliceJob(program, args.analysis, preslice=args.preslice) for program in args.programs], args.processes):
+        if result.error is not None:
+            failed += 1
+            print(f"{result.program}: failed\n{result.error}", file=sys.stderr)
+        elif args.output_dir:
+            name = os.path.splitext(os.path.basename(result.program))[0] + "-sliced.py"
+            with open(os.path.join(args.output_dir, name), "w") as file:
+                file.write(result.sliced)
+        else:
+            print(f"# {result.program}\n{result.sliced}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,189 @@
+from array import array
+from pathlib import Path
+from shutil import copyfile
+from typing import Any, Dict, Optional, Set, Tuple
+import hashlib
+import importlib.metadata
+import json
+import os
+import re
+import tempfile
+import libcst as cst
+from libcst.metadata import PositionProvider
+from dynapyt.instrument.CodeInstrumenter import CodeInstrumenter
+from dynapyt.instrument.IIDs import IIDs, Location
+from dynapyt.instrument.instrument import instrument_code
+from dynamicslicing.utils import source_hash
+
+# directory of the cache, ~/.cache/dynamicslicing by default
+CACHE_DIR_VARIABLE = "DYNAMICSLICING_CACHE_DIR"
+CACHE_FORMAT = 1
+
+# stands for the program path in cached code, which is otherwise independent of where the program lives
+PATH_PLACEHOLDER = "__DYNAMICSLICING_PROGRAM_PATH__"
+
+# hooks whose events only matter on the selected lines, when only some lines are selected
+DATA_HOOKS = {"read_identifier", "read_attribute", "read_subscript", "write", "pre_call", "post_call"}
+
+# locations of the files instrumented by this process, with the stat of their iid json when written
+_locations: Dict[str, Tuple[Tuple[int, int], Dict[int, Location]]] = {}
+
+
+def cache_dir() -> Path:
+    directory = os.environ.get(CACHE_DIR_VARIABLE)
+    if directory:
+        return Path(directory)
+    return Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "dynamicslicing"
+
+
+def cache_key(src: str, selected_hooks: Dict[str, Any], selected_lines: Optional[Set[int]] = None) -> str:
+    key = json.dumps({
+        "format": CACHE_FORMAT,
+        "source": source_hash(src),
+        "hooks": selected_hooks,
+        "lines": None if selected_lines is None else sorted(selected_lines),
+        "dynapyt": importlib.metadata.version("dynapyt"),
+    }, sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class SelectedLinesInstrumenter(CodeInstrumenter):
+    """
+        Adds data hooks on the selected lines only; function and control-flow hooks stay everywhere
+        so that frames are still tracked
+    """
+    def __init__(self, src: str, file_path: str, iids: Any, selected_hooks: Dict[str, Any], selected_lines: Set[int]) -> None:
+        super().__init__(src, file_path, iids, selected_hooks)
+        self.selected_lines = selected_lines
+        self.control_hooks = {hook: details for hook, details in self.selected_hooks.items() if hook not in DATA_HOOKS}
+
+    def on_leave(self, original_node: cst.CSTNode, updated_node: cst.CSTNode) -> Any:
+        position = self.get_metadata(PositionProvider, original_node, None)
+        if position is None or position.start.line in self.selected_lines:
+            return super().on_leave(original_node, updated_node)
+        selected_hooks, self.selected_hooks = self.selected_hooks, self.control_hooks
+        try:
+            return super().on_leave(original_node, updated_node)
+        finally:
+            self.selected_hooks = selected_hooks
+
+
+def instrument_source(
+    src: str, file_path: str, iids: Any, selected_hooks: Dict[str, Any], selected_lines: Optional[Set[int]] = None
+) -> Optional[str]:
+    """
+        dynapyt's instrument_code, with the data hooks restricted to selected_lines when given
+    """
+    if selected_lines is None or "DYNAPYT: DO NOT INSTRUMENT" in src:
+        return instrument_code(src, file_path, iids, selected_hooks)
+    instrumenter = SelectedLinesInstrumenter(src, file_path, iids, selected_hooks, selected_lines)
+    return "# DYNAPYT: DO NOT INSTRUMENT\n\n" + cst.metadata.MetadataWrapper(cst.parse_module(src)).visit(instrumenter).code
+
+
+def path_literal(path: str) -> str:
+    # the string literal dynapyt writes for the program path
+    return ("r" if "\\" in path else "") + '"' + path + '"'
+
+
+def iids_file(file_path: str) -> str:
+    return re.sub(r"\.py$", "", file_path) + "-dynapyt.json"
+
+
+def json_stat(path: str) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def write_atomically(path: Path, data: bytes) -> None:
+    # concurrent runs may fill the same entry, readers must never see half of it
+    descriptor, temporary = tempfile.mkstemp(dir=path.parent)
+    with os.fdopen(descriptor, "wb") as file:
+        file.write(data)
+    os.replace(temporary, path)
+
+
+def load_entry(key: str) -> Optional[Tuple[str, array]]:
+    entry = cache_dir() / key
+    try:
+        code = (entry / "program.py").read_text()
+        positions = array("i")
+        with open(entry / "iids.bin", "rb") as file:
+            positions.frombytes(file.read())
+    except OSError:
+        return None
+    return code, positions
+
+
+def store_entry(key: str, code: str, positions: array) -> None:
+    entry = cache_dir() / key
+    try:
+        entry.mkdir(parents=True, exist_ok=True)
+        write_atomically(entry / "iids.bin", positions.tobytes())
+        write_atomically(entry / "program.py", code.encode())
+    except OSError:
+        # a read-only or full cache only costs the next run its speedup
+        pass
+
+
+def instrument_file(file_path: str, selected_hooks: Dict[str, Any], selected_lines: Optional[Set[int]] = None) -> None:
+    """
+        Same as dynapyt's instrument_file, but the instrumented code and iid locations are cached
+        by source hash, selected hooks, selected lines and dynapyt version, so an unchanged file is
+        instrumented once. With selected_lines, such as a pre-slice, only those lines get data hooks
+    """
+    with open(file_path, "r") as file:
+        src = file.read()
+    json_file = iids_file(file_path)
+    if os.path.exists(json_file):
+        # iids continue the numbering of the existing file, which the cache does not know about
+        from dynapyt.instrument.instrument import instrument_file as dynapyt_instrument_file
+        dynapyt_instrument_file(file_path, selected_hooks)
+        return
+    orig_file = str(Path(file_path).resolve()) + ".orig"
+    key = cache_key(src, selected_hooks, selected_lines)
+    cached = load_entry(key)
+    if cached is None:
+        iids = IIDs(file_path)
+        code = instrument_source(src, file_path, iids, selected_hooks, selected_lines)
+        if code is None:
+            os.remove(json_file)
+            return
+        positions = array("i")
+        for iid in range(iids.next_iid):
+            positions.extend(iids.iid_to_location[iid][1:])
+        path_line = f'_dynapyt_ast_ = {path_literal(orig_file[:-5])} + ".orig"'
+        # code still holding the real path would run against this program wherever it is loaded
+        if path_line in code:
+            store_entry(key, code.replace(path_line, f'_dynapyt_ast_ = {PATH_PLACEHOLDER} + ".orig"', 1), positions)
+    else:
+        code, positions = cached
+        code = code.replace(PATH_PLACEHOLDER, path_literal(orig_file[:-5]), 1)
+    locations = {
+        iid: Location(orig_file, *positions[4 * iid:4 * iid + 4]) for iid in range(len(positions) // 4)
+    }
+
+    copyfile(file_path, re.sub(r"\.py$", ".py.orig", file_path))
+    with open(file_path, "w") as file:
+        file.write(code)
+    with open(json_file, "w") as file:
+        json.dump({
+            "next_iid": len(locations),
+            "iid_to_location": {iid: location._asdict() for iid, location in locations.items()},
+        }, file)
+    _locations[orig_file] = (json_stat(json_file), locations)
+
+
+def iid_locations(dyn_ast: str) -> Dict[int, Location]:
+    """
+        Returns the iid locations of an instrumented file, without reading its json again when
+        this process instrumented it
+    """
+    cached = _locations.get(dyn_ast)
+    if cached is not None:
+        stat, locations = cached
+        try:
+            if json_stat(iids_file(dyn_ast[:-5])) == stat:
+                return locations
+        except OSError:
+            pass
+    return IIDs(dyn_ast).iid_to_location
@@ -0,0 +1,244 @@
+from bisect import bisect_left
+from types import CodeType
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import dis
+import sys
+import threading
+import libcst as cst
+from libcst.metadata import PositionProvider
+from dynamicslicing.trace import TraceRecorder, NO_ID, READ, WRITE, PRE_CALL, POST_CALL, FUNCTION_ENTER, FUNCTION_EXIT, BRANCH_TAKEN, BRANCH_NOT_TAKEN
+from dynamicslicing.utils import IidEntry, iid_index, metadata_wrapper
+
+# a tool id that PEP 669 leaves unassigned
+TOOL_ID = 3
+
+# node kinds of the iids dynapyt hands out for each hook
+READ_KINDS = {"Name", "Attribute", "Subscript"}
+WRITE_KINDS = {"Assign", "AugAssign", "AnnAssign"}
+
+# sys.monitoring state is per interpreter, so recordings take turns
+_monitoring_lock = threading.Lock()
+
+
+def check_available() -> None:
+    if not hasattr(sys, "monitoring"):
+        raise RuntimeError(f"the sys.monitoring backend needs Python 3.12 or newer, this is {sys.version.split()[0]}")
+
+
+def code_objects(code: CodeType) -> Iterator[CodeType]:
+    yield code
+    for constant in code.co_consts:
+        if isinstance(constant, CodeType):
+            yield from code_objects(constant)
+
+
+class MonitoringRecorder:
+    """
+        Records the trace RecordTrace records, from sys.monitoring events of the unmodified program
+        instead of dynapyt hooks. Reads and writes are resolved per executed line, calls per call
+        instruction, and function entries and exits per code object, to the same iids dynapyt uses,
+        so Slice.replay and OfflineSlicer consume either trace alike. An if or while condition holds
+        exactly when the next line its frame runs is the first line of its body
+    """
+    def __init__(self, source: str, dyn_ast: str, locations: Dict[int, Any]) -> None:
+        check_available()
+        self.source = source
+        self.dyn_ast = dyn_ast
+        self.index = iid_index(source, locations)
+        self.trace = TraceRecorder()
+        self.source_lines = source.split("\n")
+        # line -> (read iids, write iids), writes are recorded once the rest of the line ran
+        self.line_iids: Dict[int, Tuple[List[int], List[int]]] = {}
+        # call extent -> iid, and function name -> sorted (def line, iid)
+        self.call_iids: Dict[Tuple[int, int, int, int], int] = {}
+        self.function_iids: Dict[str, List[Tuple[int, int]]] = {}
+        # if or while header line -> (iid, first line of its body), and those body lines
+        self.branch_iids: Dict[int, Tuple[int, int]] = {}
+        positions = metadata_wrapper(source).resolve(PositionProvider)
+        for iid, entry in enumerate(self.index):
+            if entry is None or entry.node is None:
+                continue
+            if entry.kind in READ_KINDS or entry.kind in WRITE_KINDS:
+                reads, writes = self.line_iids.setdefault(entry.line, ([], []))
+                (reads if entry.kind in READ_KINDS else writes).append(iid)
+            elif entry.kind == "Call":
+                self.call_iids[tuple(entry.location[1:])] = iid
+            elif entry.kind == "FunctionDef":
+                self.function_iids.setdefault(entry.node.name.value, []).append((entry.line, iid))
+            elif entry.kind in ("If", "While") and isinstance(entry.node.body, cst.IndentedBlock):
+                # the body of "if x: y" runs on the header line, so its outcome cannot be told from lines
+                self.branch_iids[entry.line] = (iid, positions[entry.node.body.body[0]].start.line)
+        self.body_lines = {body_line for _, body_line in self.branch_iids.values()}
+        for reads, writes in self.line_iids.values():
+            reads.sort(key=lambda iid: self.index[iid].location[1:])
+        for definitions in self.function_iids.values():
+            definitions.sort()
+        self.codes: Dict[CodeType, Optional[int]] = {}
+        self.call_sites: Dict[CodeType, Dict[int, int]] = {}
+        self.frames = [NO_ID]
+        # per running frame: its function iid and the writes of its current line
+        self.stack: List[Tuple[Optional[int], List[int]]] = [(None, [])]
+        # per running frame: the if or while whose condition its last line evaluated
+        self.branches: List[Optional[Tuple[int, int]]] = [None]
+
+    def column(self, line: int, byte_column: int) -> int:
+        # code positions count UTF-8 bytes, libcst counts characters
+        text = self.source_lines[line - 1] if 0 < line <= len(self.source_lines) else ""
+        if text.isascii():
+            return byte_column
+        return len(text.encode("utf-8")[:byte_column].decode("utf-8", "ignore"))
+
+    def function_iid(self, code: CodeType) -> Optional[int]:
+        # a decorated function's code starts at its first decorator, at or before the def line
+        definitions = self.function_iids.get(code.co_name, ())
+        position = bisect_left(definitions, (code.co_firstlineno, -1))
+        return definitions[position][1] if position < len(definitions) else None
+
+    def register(self, code: CodeType) -> None:
+        """
+            Resolves the functions and call sites of a compiled program and enables its local events
+        """
+        events = sys.monitoring.events
+        local_events = events.PY_START | events.PY_RESUME | events.PY_RETURN | events.PY_YIELD | events.LINE | events.CALL
+        for nested in code_objects(code):
+            self.codes[nested] = None if nested is code else self.function_iid(nested)
+            call_sites = self.call_sites[nested] = {}
+            for instruction in dis.get_instructions(nested):
+                position = instruction.positions
+                if instruction.opname.startswith("CALL") and position is not None and position.lineno is not None:
+                    extent = (position.lineno, self.column(position.lineno, position.col_offset),
+                              position.end_lineno, self.column(position.end_lineno, position.end_col_offset))
+                    iid = self.call_iids.get(extent)
+                    if iid is not None:
+                        call_sites[instruction.offset] = iid
+            sys.monitoring.set_local_events(TOOL_ID, nested, local_events)
+
+    def record(self, kind: int, iid: int) -> int:
+        entry: IidEntry = self.index[iid]
+        return self.trace.append(kind, iid, entry.line, self.frames[-1], entry.name, self.dyn_ast)
+
+    def flush(self) -> None:
+        writes = self.stack[-1][1]
+        for iid in writes:
+            self.record(WRITE, iid)
+        writes.clear()
+
+    def resolve_branch(self, line: Optional[int]) -> None:
+        """
+            Records the outcome of the condition evaluated by the frame's last line, given the next line the
+            frame runs (None when it returns instead)
+        """
+        branch = self.branches[-1]
+        if branch is None:
+            return
+        self.branches[-1] = None
+        self.flush()
+        iid, body_line = branch
+        self.record(BRANCH_TAKEN if line == body_line else BRANCH_NOT_TAKEN, iid)
+
+    def enter(self, code: CodeType, start: bool) -> None:
+        function = self.codes.get(code)
+        event = self.frames[-1]
+        if function is not None and start:
+            event = self.record(FUNCTION_ENTER, function)
+        self.frames.append(event)
+        self.stack.append((function, []))
+        self.branches.append(None)
+
+    def leave(self, code: CodeType, returned: bool) -> None:
+        self.flush()
+        self.branches.pop()
+        function, _ = self.stack.pop()
+        if function is not None and returned:
+            self.record(FUNCTION_EXIT, function)
+        if len(self.frames) > 1:
+            self.frames.pop()
+
+    def on_line(self, code: CodeType, line: int) -> Any:
+        self.resolve_branch(line)
+        iids = self.line_iids.get(line)
+        branch = self.branch_iids.get(line)
+        if iids is None and branch is None and line not in self.body_lines:
+            return sys.monitoring.DISABLE
+        self.flush()
+        if iids is not None:
+            reads, writes = iids
+            for iid in reads:
+                self.record(READ, iid)
+            self.stack[-1][1].extend(writes)
+        self.branches[-1] = branch
+
+    def on_call(self, code: CodeType, offset: int, function: Any, argument: Any) -> Any:
+        iid = self.call_sites[code].get(offset)
+        if iid is None:
+            return sys.monitoring.DISABLE
+        self.record(PRE_CALL, iid)
+        self.record(POST_CALL, iid)
+
+    def on_start(self, code: CodeType, offset: int) -> None:
+        self.enter(code, True)
+
+    def on_resume(self, code: CodeType, offset: int) -> None:
+        self.enter(code, False)
+
+    def on_return(self, code: CodeType, offset: int, value: Any) -> None:
+        self.resolve_branch(None)
+        self.leave(code, True)
+
+    def on_yield(self, code: CodeType, offset: int, value: Any) -> None:
+        self.leave(code, False)
+
+    def on_unwind(self, code: CodeType, offset: int, exception: BaseException) -> None:
+        # unwinding can only be monitored globally
+        if code in self.codes:
+            self.leave(code, True)
+
+    def on_handled(self, code: CodeType, offset: int, exception: BaseException) -> None:
+        # a condition that raised has no outcome
+        if code in self.codes:
+            self.branches[-1] = None
+
+    def run(self, code: CodeType, globals: Dict[str, Any]) -> None:
+        """
+            Executes a compiled program while recording its events
+        """
+        monitoring = sys.monitoring
+        events = monitoring.events
+        callbacks = {
+            events.LINE: self.on_line,
+            events.CALL: self.on_call,
+            events.PY_START: self.on_start,
+            events.PY_RESUME: self.on_resume,
+            events.PY_RETURN: self.on_return,
+            events.PY_YIELD: self.on_yield,
+            events.PY_UNWIND: self.on_unwind,
+            events.EXCEPTION_HANDLED: self.on_handled,
+        }
+        with _monitoring_lock:
+            monitoring.use_tool_id(TOOL_ID, "dynamicslicing")
+            try:
+                for event, callback in callbacks.items():
+                    monitoring.register_callback(TOOL_ID, event, callback)
+                self.register(code)
+                monitoring.set_events(TOOL_ID, events.PY_UNWIND | events.EXCEPTION_HANDLED)
+                # events disabled by an earlier recording start out enabled again
+                monitoring.restart_events()
+                try:
+                    exec(code, globals)
+                finally:
+                    monitoring.set_events(TOOL_ID, events.NO_EVENTS)
+                    for nested in self.codes:
+                        monitoring.set_local_events(TOOL_ID, nested, events.NO_EVENTS)
+                    self.resolve_branch(None)
+                    self.flush()
+            finally:
+                for event in callbacks:
+                    monitoring.register_callback(TOOL_ID, event, None)
+                monitoring.free_tool_id(TOOL_ID)
+
+    def metadata(self) -> Dict[str, Any]:
+        return {
+            "source_file": self.dyn_ast,
+            "sources": {self.dyn_ast: self.source},
+            "iids": {self.dyn_ast: [[iid, *entry.location[1:]] for iid, entry in enumerate(self.index) if entry is not None]},
+        }
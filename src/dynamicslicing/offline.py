@@ -0,0 +1,197 @@
+import argparse
+import os
+import re
+import libcst as cst
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from dynapyt.analyses.BaseAnalysis import BaseAnalysis
+from dynapyt.instrument.IIDs import Location
+from dynamicslicing.trace import TraceRecorder, NO_ID, READ, WRITE, PRE_CALL, POST_CALL, FUNCTION_ENTER, FUNCTION_EXIT, BRANCH_TAKEN, BRANCH_NOT_TAKEN
+from dynamicslicing.dependence import DependenceGraph
+from dynamicslicing.events import TraceIndex
+from dynamicslicing.instrument_cache import iid_locations
+from dynamicslicing.utils import IidEntry, iid_index, program_structure, slicing_criteria
+from dynamicslicing.slice import Slice
+from dynamicslicing.slice_dataflow import SliceDataflow
+
+ANALYSES = {"full": Slice, "dataflow": SliceDataflow}
+
+
+def trace_file_name(source: str) -> str:
+    return re.sub(r"\.py(\.orig)?$", "", source) + "-trace.bin"
+
+
+class RecordTrace(BaseAnalysis):
+    """
+        Records the dynamic trace of a program so that it can be sliced offline for any criterion
+    """
+    def __init__(self, source):
+        super().__init__()
+        self.args = source
+        self.iid_indices = {}
+        self.sources = {}
+        self.trace = TraceRecorder()
+        self.frames = [NO_ID]
+
+    def iid_entry(self, dyn_ast: str, iid: int) -> IidEntry:
+        index = self.iid_indices.get(dyn_ast)
+        if index is None:
+            with open(dyn_ast, "r") as file:
+                self.sources[dyn_ast] = file.read()
+            index = self.iid_indices[dyn_ast] = iid_index(self.sources[dyn_ast], iid_locations(dyn_ast))
+        return index[iid]
+
+    def record(self, kind: int, dyn_ast: str, iid: int) -> int:
+        entry = self.iid_entry(dyn_ast, iid)
+        return self.trace.append(kind, iid, entry.line, self.frames[-1], entry.name, dyn_ast)
+
+    def read(self, dyn_ast: str, iid: int, val: Any) -> Any:
+        self.record(READ, dyn_ast, iid)
+
+    def write(self, dyn_ast: str, iid: int, old_vals: List[Callable], new_val: Any) -> Any:
+        self.record(WRITE, dyn_ast, iid)
+
+    def pre_call(self, dyn_ast: str, iid: int, function: Callable, pos_args: Tuple, kw_args: Dict):
+        self.record(PRE_CALL, dyn_ast, iid)
+
+    def post_call(
+        self, dyn_ast: str, iid: int, result: Any, call: Callable, pos_args: Tuple, kw_args: Dict
+    ) -> Any:
+        self.record(POST_CALL, dyn_ast, iid)
+
+    def function_enter(self, dyn_ast: str, iid: int, args: List[Any], name: str, is_lambda: bool) -> None:
+        self.frames.append(self.record(FUNCTION_ENTER, dyn_ast, iid))
+
+    def function_exit(self, dyn_ast: str, iid: int, function_name: str, result: Any) -> Any:
+        self.record(FUNCTION_EXIT, dyn_ast, iid)
+        if len(self.frames) > 1:
+            self.frames.pop()
+
+    def enter_if(self, dyn_ast: str, iid: int, cond_value: bool) -> Optional[bool]:
+        self.record(BRANCH_TAKEN if cond_value else BRANCH_NOT_TAKEN, dyn_ast, iid)
+        # returning None leaves the condition as it is
+
+    def enter_while(self, dyn_ast: str, iid: int, cond_value: bool) -> Optional[bool]:
+        self.record(BRANCH_TAKEN if cond_value else BRANCH_NOT_TAKEN, dyn_ast, iid)
+
+    def metadata(self) -> Dict[str, Any]:
+        return {
+            "source_file": re.sub(r"\.py$", ".py.orig", self.args),
+            "sources": self.sources,
+            "iids": {
+                file: [[iid, *entry.location[1:]] for iid, entry in enumerate(index) if entry is not None]
+                for file, index in self.iid_indices.items()
+            },
+        }
+
+    def end_execution(self) -> None:
+        self.trace.save(trace_file_name(self.args), self.metadata())
+
+
+class OfflineSlicer:
+    """
+        Answers any number of slicing criteria against a trace written by RecordTrace,
+        without running the program again
+    """
+    def __init__(self, trace_file: str) -> None:
+        self.setup(*TraceRecorder.load(trace_file))
+
+    @classmethod
+    def from_trace(cls, trace: TraceRecorder, metadata: Dict[str, Any]) -> "OfflineSlicer":
+        slicer = cls.__new__(cls)
+        slicer.setup(trace, metadata)
+        return slicer
+
+    def setup(self, trace: TraceRecorder, metadata: Dict[str, Any]) -> None:
+        self.trace = trace
+        self.source_file = metadata["source_file"]
+        self.sources = metadata["sources"]
+        # decoded once and shared by every slice
+        self.iid_indices = {
+            file: iid_index(self.sources[file], {iid: Location(file, *position) for iid, *position in iids})
+            for file, iids in metadata["iids"].items()
+        }
+        # built on first use, with and without control dependences, and shared with their CSR arrays by every slice
+        self.dependence_graphs = {}
+        # the events grouped once by what the handlers look at, so a slice only replays its own names
+        self.index = None
+
+    def iid_entry(self, file: str, iid: int) -> IidEntry:
+        return self.iid_indices[file][iid]
+
+    def event_node(self, event: int) -> cst.CSTNode:
+        return self.iid_entry(self.trace.file(event), self.trace.iid(event)).node
+
+    def enclosing_header(self, file: str, line: int) -> Optional[int]:
+        return program_structure(self.sources[file]).branch_headers.get(line)
+
+    def source(self) -> str:
+        if self.source_file in self.sources:
+            return self.sources[self.source_file]
+        with open(self.source_file, "r") as file:
+            return file.read()
+
+    def analysis(self, line: int, variables: Optional[Set[str]] = None, analysis: str = "full") -> BaseAnalysis:
+        slicer = ANALYSES[analysis](self.source_file, criterion=(line, variables), code=self.source())
+        slicer.iid_indices = self.iid_indices
+        control = slicer.control_dependences
+        if control not in self.dependence_graphs:
+            enclosing = self.enclosing_header if control else None
+            self.dependence_graphs[control] = DependenceGraph.from_trace(self.trace, self.iid_entry, enclosing)
+        slicer.dependence_graph = self.dependence_graphs[control]
+        if self.index is None:
+            self.index = TraceIndex(self.trace, self.iid_entry)
+        slicer.replay(self.trace, self.index)
+        return slicer
+
+    def slice(self, line: int, variables: Optional[Set[str]] = None, analysis: str = "full") -> str:
+        """
+            Returns the program sliced for the variables used on (or given for) line
+        """
+        return self.analysis(line, variables, analysis).slice_code()
+
+
+class BatchSlice(RecordTrace):
+    """
+        Slices one run of a program for several criteria: every "# slicing criterion" comment,
+        or an explicit list of (line, variables) tuples
+    """
+    def __init__(self, source, criteria: Optional[List[Tuple[int, Optional[Set[str]]]]] = None, analysis: str = "full"):
+        super().__init__(source)
+        self.criteria = criteria
+        self.analysis = analysis
+        self.results = {}
+
+    def slice_all(self) -> Dict[Tuple[int, Optional[frozenset]], str]:
+        slicer = OfflineSlicer.from_trace(self.trace, self.metadata())
+        criteria = self.criteria
+        if criteria is None:
+            criteria = [(line, variables) for variables, line in slicing_criteria(slicer.source())]
+        for line, variables in criteria:
+            key = (line, frozenset(variables) if variables else None)
+            # the same criterion given twice is only sliced once
+            if key not in self.results:
+                self.results[key] = slicer.slice(line, variables, self.analysis)
+        return self.results
+
+    def end_execution(self) -> None:
+        for (line, variables), sliced_code in self.slice_all().items():
+            output_file_name = os.path.join(os.path.dirname(self.args), sliced_file_name(line, variables))
+            with open(output_file_name, "w") as output_file:
+                output_file.write(sliced_code)
+
+
+def sliced_file_name(line: int, variables: Optional[frozenset] = None) -> str:
+    if not variables:
+        return f"sliced_{line}.py"
+    return f"sliced_{line}_{'_'.join(sorted(variables))}.py"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Slice a recorded trace without re-running the program")
+    parser.add_argument("trace", help="Trace file written by dynamicslicing.offline.RecordTrace")
+    parser.add_argument("--line", type=int, required=True, help="Line of the slicing criterion")
+    parser.add_argument("--variables", nargs="*", default=None, help="Variables of the criterion (default: all used on the line)")
+    parser.add_argument("--analysis", choices=sorted(ANALYSES), default="full")
+    args = parser.parse_args()
+    variables = set(args.variables) if args.variables else None
+    print(OfflineSlicer(args.trace).slice(args.line, variables, args.analysis))
@@ -0,0 +1,170 @@
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+import libcst as cst
+import libcst.matchers as m
+from libcst.metadata import PositionProvider
+from dynamicslicing.utils import metadata_wrapper, slicing_criterion, slicing_criterion_at
+
+NO_UNIT = -1
+
+
+class StaticUnit(NamedTuple):
+    first_line: int
+    last_line: int
+    defs: frozenset
+    uses: frozenset
+    parent: int
+    # function and class bodies are kept whole once their definition is relevant
+    scope: bool
+
+
+def names_in(node: cst.CSTNode) -> Set[str]:
+    return {name.value for name in m.findall(node, m.Name())}
+
+
+class StaticDependences(cst.CSTVisitor):
+    """
+        Splits a module into statements and compound-statement headers with the names they may
+        define and use, and the header they are control dependent on
+    """
+    METADATA_DEPENDENCIES = (PositionProvider,)
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.units: List[StaticUnit] = []
+        self.enclosing = [NO_UNIT]
+        # calls without arguments are always part of the slice
+        self.zero_argument_call_lines: Set[int] = set()
+
+    def add_unit(self, node: cst.CSTNode, last: Optional[cst.CSTNode], defs: Set[str], uses: Set[str], scope: bool = False) -> int:
+        first_line = self.get_metadata(PositionProvider, node).start.line
+        last_line = self.get_metadata(PositionProvider, last).end.line if last is not None else first_line
+        self.units.append(StaticUnit(first_line, last_line, frozenset(defs), frozenset(uses), self.enclosing[-1], scope))
+        return len(self.units) - 1
+
+    def add_header(self, node: cst.CSTNode, last: Optional[cst.CSTNode], defs: Set[str], uses: Set[str], scope: bool = False) -> None:
+        self.enclosing.append(self.add_unit(node, last, defs, uses, scope))
+
+    def leave_header(self, original_node: cst.CSTNode) -> None:
+        self.enclosing.pop()
+
+    def add_statements(self, node: cst.CSTNode, statements: List[cst.BaseSmallStatement]) -> None:
+        defs, uses = set(), set()
+        for statement in statements:
+            if isinstance(statement, cst.Assign):
+                for target in statement.targets:
+                    defs.update(names_in(target.target))
+            elif isinstance(statement, (cst.AugAssign, cst.AnnAssign)):
+                defs.update(names_in(statement.target))
+            elif isinstance(statement, (cst.Import, cst.ImportFrom)):
+                defs.update(names_in(statement))
+                continue
+            uses.update(names_in(statement))
+            for call in m.findall(statement, m.Call()):
+                # a call may change the object it is called on and the objects passed to it, and makes
+                # its function relevant
+                defs.update(names_in(call.func))
+                for argument in call.args:
+                    defs.update(names_in(argument.value))
+                if len(call.args) == 0:
+                    self.zero_argument_call_lines.add(self.get_metadata(PositionProvider, call).start.line)
+        self.add_unit(node, node, defs, uses)
+
+    def visit_SimpleStatementLine(self, node: cst.SimpleStatementLine) -> None:
+        self.add_statements(node, node.body)
+
+    def visit_SimpleStatementSuite(self, node: cst.SimpleStatementSuite) -> None:
+        self.add_statements(node, node.body)
+
+    def visit_If(self, node: cst.If) -> None:
+        self.add_header(node, node.test, set(), names_in(node.test))
+
+    def visit_While(self, node: cst.While) -> None:
+        self.add_header(node, node.test, set(), names_in(node.test))
+
+    def visit_For(self, node: cst.For) -> None:
+        self.add_header(node, node.iter, names_in(node.target), names_in(node.iter) | names_in(node.target))
+
+    def visit_With(self, node: cst.With) -> None:
+        defs, uses = set(), set()
+        for item in node.items:
+            uses.update(names_in(item.item))
+            if item.asname is not None:
+                defs.update(names_in(item.asname))
+        self.add_header(node, node.items[-1], defs, uses | defs)
+
+    def visit_Try(self, node: cst.Try) -> None:
+        self.add_header(node, None, set(), set())
+
+    def visit_FunctionDef(self, node: cst.FunctionDef) -> None:
+        self.add_header(node, node.params, {node.name.value}, names_in(node.params) | {node.name.value}, scope=True)
+
+    def visit_ClassDef(self, node: cst.ClassDef) -> None:
+        uses = {node.name.value}
+        for base in node.bases:
+            uses.update(names_in(base.value))
+        self.add_header(node, None, {node.name.value}, uses, scope=True)
+
+    leave_If = leave_While = leave_For = leave_With = leave_Try = leave_FunctionDef = leave_ClassDef = leave_header
+
+
+def static_slice(code: str, line: int, variables: Optional[Set[str]] = None) -> Set[int]:
+    """
+        Returns the lines that may belong to the dynamic slice for the variables of line: an
+        over-approximate backward slice over name-based def-use and control dependences
+    """
+    dependences = StaticDependences()
+    metadata_wrapper(code).visit(dependences)
+    units = dependences.units
+    definers: Dict[str, List[int]] = {}
+    children: Dict[int, List[int]] = {}
+    for i, unit in enumerate(units):
+        for name in unit.defs:
+            definers.setdefault(name, []).append(i)
+        children.setdefault(unit.parent, []).append(i)
+
+    relevant, worklist, names = set(), [], set()
+
+    def mark(i: int) -> None:
+        if i != NO_UNIT and i not in relevant:
+            relevant.add(i)
+            worklist.append(i)
+
+    def mark_names(new_names: Set[str]) -> None:
+        for name in new_names - names:
+            names.add(name)
+            for i in definers.get(name, ()):
+                mark(i)
+
+    for i, unit in enumerate(units):
+        if unit.first_line <= line <= unit.last_line:
+            mark(i)
+    mark_names({part for variable in variables or () for part in variable.split(".")})
+    while worklist:
+        i = worklist.pop()
+        unit = units[i]
+        mark(unit.parent)
+        mark_names(unit.uses)
+        if unit.scope:
+            body = list(children.get(i, ()))
+            while body:
+                child = body.pop()
+                mark(child)
+                body.extend(children.get(child, ()))
+    lines = {line} | dependences.zero_argument_call_lines
+    for i in relevant:
+        lines.update(range(units[i].first_line, units[i].last_line + 1))
+    return lines
+
+
+def relevant_lines(src: str, criterion: Optional[Tuple[int, Optional[Set[str]]]] = None) -> Set[int]:
+    """
+        Returns the static pre-slice of the criterion (the "# slicing criterion" comment by
+        default), the lines instrument_cache.instrument_file can restrict its data hooks to
+    """
+    if criterion is None:
+        variables, line = slicing_criterion(src)
+    else:
+        line, variables = criterion
+        if variables is None:
+            variables = slicing_criterion_at(src, line)
+    return static_slice(src, line, variables)
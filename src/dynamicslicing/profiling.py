@@ -0,0 +1,182 @@
+from array import array
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, ContextManager, Dict, Iterator, Tuple, Union
+import functools
+import json
+import os
+import random
+import time
+
+# path of the json report; profiling is off unless it is set
+PROFILE_VARIABLE = "DYNAMICSLICING_PROFILE"
+
+PROFILED_HOOKS = ("read", "write", "pre_call", "post_call", "function_enter", "function_exit", "end_execution")
+# the live analyses' hooks only buffer events, these do the analysis work when the buffer is drained
+PROFILED_HANDLERS = ("on_read", "on_write", "on_pre_call", "on_post_call", "on_function_enter")
+PERCENTILES = (50, 90, 99)
+# latency samples kept per hook or handler, so long runs profile in constant memory
+RESERVOIR_SIZE = 4096
+
+
+def percentile(sorted_samples: array, p: int) -> int:
+    if len(sorted_samples) == 0:
+        return 0
+    return sorted_samples[min(len(sorted_samples) - 1, (len(sorted_samples) * p) // 100)]
+
+
+class Latencies:
+    """
+        Counts, totals and keeps the maximum of all latencies exactly, and a uniform reservoir
+        sample of at most RESERVOIR_SIZE of them for the percentiles
+    """
+    __slots__ = ("calls", "total", "max", "samples", "random")
+
+    def __init__(self, seed: int = 0) -> None:
+        self.calls = 0
+        self.total = 0
+        self.max = 0
+        self.samples = array("q")
+        self.random = random.Random(seed)
+
+    def add(self, elapsed: int) -> None:
+        self.calls += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        if len(self.samples) < RESERVOIR_SIZE:
+            self.samples.append(elapsed)
+        else:
+            slot = self.random.randrange(self.calls)
+            if slot < RESERVOIR_SIZE:
+                self.samples[slot] = elapsed
+
+    def summary(self) -> Dict[str, int]:
+        samples = array("q", sorted(self.samples))
+        return {
+            "calls": self.calls,
+            "total_ns": self.total,
+            **{f"p{p}_ns": percentile(samples, p) for p in PERCENTILES},
+            "max_ns": self.max,
+        }
+
+
+class Profiler:
+    """
+        Wraps the hooks and event handlers of one analysis instance to count calls and time them,
+        per hook, per handler and per source line, and times the named phases of end_execution.
+        The report is written to report_file whenever slice_code or end_execution returns
+    """
+    def __init__(self, analysis: Any, report_file: str) -> None:
+        self.analysis = analysis
+        self.report_file = report_file
+        self.latencies: Dict[str, Latencies] = {}
+        self.handler_latencies: Dict[str, Latencies] = {}
+        self.line_events: Dict[Tuple[str, int], int] = {}
+        self.line_times: Dict[Tuple[str, int], int] = {}
+        self.line_handler_times: Dict[Tuple[str, int], int] = {}
+        self.phases: Dict[str, float] = {}
+        for hook in PROFILED_HOOKS:
+            method = getattr(analysis, hook, None)
+            if method is not None:
+                latencies = self.latencies[hook] = Latencies()
+                setattr(analysis, hook, self.wrap(hook, method, latencies, self.count_line))
+        for handler in PROFILED_HANDLERS:
+            method = getattr(analysis, handler, None)
+            if method is not None:
+                latencies = self.handler_latencies[handler] = Latencies()
+                setattr(analysis, handler, self.wrap(handler, method, latencies, self.count_handler_line))
+        # api.slice_source and the server call slice_code without dynapyt's end_execution
+        slice_code = getattr(analysis, "slice_code", None)
+        if slice_code is not None:
+            setattr(analysis, "slice_code", self.dumping(slice_code))
+
+    def wrap(self, hook: str, method: Callable, latencies: Latencies, count_line: Callable[[Any, int, int], None]) -> Callable:
+        @functools.wraps(method)
+        def profiled(*args: Any) -> Any:
+            start = time.perf_counter_ns()
+            try:
+                return method(*args)
+            finally:
+                elapsed = time.perf_counter_ns() - start
+                latencies.add(elapsed)
+                if len(args) >= 2:
+                    count_line(args[0], args[1], elapsed)
+                if hook == "end_execution":
+                    self.dump()
+        return profiled
+
+    def dumping(self, method: Callable) -> Callable:
+        @functools.wraps(method)
+        def dumped(*args: Any) -> Any:
+            try:
+                return method(*args)
+            finally:
+                self.dump()
+        return dumped
+
+    def count_line(self, dyn_ast: str, iid: int, elapsed: int) -> None:
+        iid_entry = getattr(self.analysis, "iid_entry", None)
+        if iid_entry is None:
+            return
+        entry = iid_entry(dyn_ast, iid)
+        key = (dyn_ast, entry.line if entry is not None else 0)
+        self.line_events[key] = self.line_events.get(key, 0) + 1
+        self.line_times[key] = self.line_times.get(key, 0) + elapsed
+
+    def count_handler_line(self, entry: Any, event: int, elapsed: int) -> None:
+        key = (self.analysis.trace.file(event), entry.line)
+        self.line_handler_times[key] = self.line_handler_times.get(key, 0) + elapsed
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    @staticmethod
+    def summary(latencies: Dict[str, Latencies]) -> Dict[str, Dict[str, int]]:
+        return {name: samples.summary() for name, samples in latencies.items() if samples.calls > 0}
+
+    def report(self) -> Dict[str, Any]:
+        lines = []
+        for key in self.line_events.keys() | self.line_handler_times.keys():
+            hook_ns, handler_ns = self.line_times.get(key, 0), self.line_handler_times.get(key, 0)
+            lines.append({
+                "file": key[0],
+                "line": key[1],
+                "events": self.line_events.get(key, 0),
+                "hook_ns": hook_ns,
+                "handler_ns": handler_ns,
+                "total_ns": hook_ns + handler_ns,
+            })
+        # the most expensive lines first
+        lines.sort(key=lambda entry: entry["total_ns"], reverse=True)
+        return {
+            "analysis": type(self.analysis).__name__,
+            "hooks": self.summary(self.latencies),
+            "handlers": self.summary(self.handler_latencies),
+            "phases": self.phases,
+            "lines": lines,
+        }
+
+    def dump(self) -> None:
+        with open(self.report_file, "w") as file:
+            json.dump(self.report(), file, indent=2)
+
+
+class NoProfiler:
+    def phase(self, name: str) -> ContextManager[None]:
+        return nullcontext()
+
+
+NO_PROFILER = NoProfiler()
+
+
+def profiler_for(analysis: Any) -> Union[Profiler, NoProfiler]:
+    """
+        Profiles analysis when DYNAMICSLICING_PROFILE names a report file
+    """
+    report_file = os.environ.get(PROFILE_VARIABLE)
+    return Profiler(analysis, report_file) if report_file else NO_PROFILER
@@ -0,0 +1,148 @@
+import argparse
+import json
+import os
+import select
+import signal
+import socketserver
+import sys
+import threading
+from typing import Any, Dict, IO, Optional
+
+from dynamicslicing.api import SourceSlice, prepare, run
+
+# seconds a worker may run before it is killed, unless the request says otherwise
+DEFAULT_TIMEOUT = 60.0
+# without fork the program runs in the server, and dynapyt's runtime holds one analysis at a time
+RUN_LOCK = threading.Lock()
+
+
+def result_json(result: SourceSlice) -> Dict[str, Any]:
+    return {
+        "lines": sorted(result.lines),
+        "criteria": sorted(result.criteria),
+        "sliced": result.sliced,
+        "output": result.output,
+    }
+
+
+def run_in_worker(slicer: Any, code: Any, timeout: float) -> Dict[str, Any]:
+    """
+        Runs a prepared program in a forked worker, so that it inherits the warm imports and caches
+        but cannot change the state of the server, and reads its result from a pipe
+    """
+    if not hasattr(os, "fork"):
+        with RUN_LOCK:
+            return result_json(run(slicer, code))
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        try:
+            response = result_json(run(slicer, code))
+        except BaseException as error:
+            response = {"error": f"{type(error).__name__}: {error}"}
+        with os.fdopen(write_end, "w") as pipe:
+            json.dump(response, pipe)
+        # skip the exit handlers inherited from the server
+        os._exit(0)
+    os.close(write_end)
+    with os.fdopen(read_end, "r") as pipe:
+        # the worker writes its result in one go when it is done
+        ready, _, _ = select.select([pipe], [], [], timeout)
+        if not ready:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            return {"error": f"timed out after {timeout} seconds"}
+        data = pipe.read()
+    os.waitpid(pid, 0)
+    if not data:
+        return {"error": "the worker exited without a result"}
+    return json.loads(data)
+
+
+def handle_request(request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+        Answers one request: {"source": code} or {"program": path}, with an optional
+        "criterion": [line, [variables] or null], "analysis": "full", "dataflow", "shadow" or "forward",
+        "preslice": true or false and "timeout"
+    """
+    try:
+        source = request.get("source")
+        if source is None:
+            with open(request["program"], "r") as file:
+                source = file.read()
+        criterion = request.get("criterion")
+        if criterion is not None:
+            line, variables = criterion
+            criterion = (line, set(variables) if variables is not None else None)
+        # instrumenting and parsing here keeps the results cached for the following requests
+        slicer, code = prepare(source, criterion, request.get("analysis", "full"), bool(request.get("preslice", False)))
+        response = run_in_worker(slicer, code, request.get("timeout", DEFAULT_TIMEOUT))
+    except Exception as error:
+        response = {"error": f"{type(error).__name__}: {error}"}
+    if "id" in request:
+        response["id"] = request["id"]
+    return response
+
+
+def serve_stream(reader: IO[str], writer: IO[str]) -> bool:
+    """
+        Answers JSON-lines requests until the reader ends or a {"shutdown": true} request arrives,
+        and returns whether the server should stop
+    """
+    for line in reader:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError as error:
+            response = {"error": f"invalid request: {error}"}
+        else:
+            if request.get("shutdown"):
+                return True
+            response = handle_request(request)
+        writer.write(json.dumps(response) + "\n")
+        writer.flush()
+    return False
+
+
+class SliceRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self) -> None:
+        with self.request.makefile("r") as reader, self.request.makefile("w") as writer:
+            if serve_stream(reader, writer):
+                # called from the connection's thread, so it does not wait on itself
+                self.server.shutdown()
+
+
+class SliceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+        Serves every connection on a Unix socket in its own thread; every request runs in its own worker
+    """
+    # connections still open at shutdown do not keep the server alive
+    daemon_threads = True
+
+
+def serve_socket(path: str) -> None:
+    if os.path.exists(path):
+        os.remove(path)
+    with SliceServer(path, SliceRequestHandler) as server:
+        try:
+            server.serve_forever()
+        finally:
+            os.remove(path)
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Resident slicing server speaking JSON lines")
+    transport = parser.add_mutually_exclusive_group(required=True)
+    transport.add_argument("--socket", help="Path of the Unix socket to listen on")
+    transport.add_argument("--stdio", action="store_true", help="Read requests from stdin, write results to stdout")
+    args = parser.parse_args(argv)
+    if args.stdio:
+        serve_stream(sys.stdin, sys.stdout)
+    else:
+        serve_socket(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,653 @@
+import os
+import weakref
+from collections import OrderedDict
+import libcst as cst
+from libcst.metadata import PositionProvider
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from dynamicslicing.trace import NO_ID, READ, WRITE, PRE_CALL, POST_CALL, FUNCTION_ENTER, FUNCTION_EXIT
+from dynapyt.analyses.BaseAnalysis import BaseAnalysis
+from dynamicslicing.dependence import DependenceGraph
+from dynamicslicing.instrument_cache import iid_locations
+from dynamicslicing.offline import RecordTrace
+from dynamicslicing.utils import IidEntry, iid_index, metadata_wrapper, remove_lines, slicing_criterion, slicing_criterion_at
+
+# values that cannot be mutated, so calling their methods defines nothing
+IMMUTABLE_TYPES = (int, float, complex, bool, str, bytes, tuple, frozenset, type(None))
+
+# cell key of a whole object, for mutations that are not tied to one attribute or index
+WHOLE = None
+
+
+# objects that cannot be weakly referenced keep their cells this long, oldest first, once no
+# variable is bound to them any more
+MAX_LOOSE_OBJECTS = 256
+
+
+def unreferenceable(value: Any) -> bool:
+    # lists, dicts and sets cannot be weakly referenced
+    return not isinstance(value, IMMUTABLE_TYPES) and type(value).__weakrefoffset__ == 0
+
+
+class ShadowMemory:
+    """
+        Maps every storage location to the event that last wrote it (or to what that write depends
+        on): (frame, name) for variables and (object id, attribute or index) for object cells. Object
+        cells are dropped through a weak reference when their object is collected. Objects that
+        cannot be weakly referenced are alive while a variable is bound to them; after that they
+        are kept, so that their id is not reused while it is mapped, among the last
+        MAX_LOOSE_OBJECTS such objects only. Names a frame declares global or nonlocal live in the
+        frame that holds them
+    """
+    def __init__(self) -> None:
+        self.names: Dict[int, Dict[str, int]] = {NO_ID: {}}
+        # the object each variable is bound to, to resolve the base of p.x = ... and xs[i] = ...
+        self.bindings: Dict[int, Dict[str, Any]] = {NO_ID: {}}
+        # per frame, the frames its global and nonlocal names live in
+        self.scopes: Dict[int, Dict[str, int]] = {}
+        self.cells: Dict[int, Dict[Any, int]] = {}
+        self.refs: Dict[int, Any] = {}
+        # ids of unreferenceable objects with the number of variables bound to them, and the
+        # mapped ones no variable is bound to
+        self.holders: Dict[int, int] = {}
+        self.loose: "OrderedDict[int, Any]" = OrderedDict()
+
+    def enter(self, frame: int, scopes: Optional[Dict[str, int]] = None) -> None:
+        self.names[frame] = {}
+        self.bindings[frame] = {}
+        if scopes:
+            self.scopes[frame] = scopes
+
+    def leave(self, frame: int) -> None:
+        if frame != NO_ID:
+            self.names.pop(frame, None)
+            self.scopes.pop(frame, None)
+            for value in self.bindings.pop(frame, {}).values():
+                self.release(value)
+
+    def scope(self, frame: int, name: str) -> int:
+        scopes = self.scopes.get(frame)
+        while scopes is not None and name in scopes:
+            frame = scopes[name]
+            scopes = self.scopes.get(frame)
+        return frame
+
+    def forget(self, key: int) -> None:
+        self.refs.pop(key, None)
+        self.cells.pop(key, None)
+
+    def hold(self, value: Any) -> None:
+        if unreferenceable(value):
+            key = id(value)
+            self.holders[key] = self.holders.get(key, 0) + 1
+            self.loose.pop(key, None)
+
+    def release(self, value: Any) -> None:
+        if not unreferenceable(value):
+            return
+        key = id(value)
+        holders = self.holders.pop(key, 1) - 1
+        if holders:
+            self.holders[key] = holders
+        elif key in self.cells:
+            self.loosen(key, value)
+
+    def loosen(self, key: int, value: Any) -> None:
+        self.loose[key] = value
+        self.loose.move_to_end(key)
+        while len(self.loose) > MAX_LOOSE_OBJECTS:
+            self.cells.pop(self.loose.popitem(last=False)[0], None)
+
+    def watch(self, value: Any) -> int:
+        key = id(value)
+        if key in self.refs or key in self.holders:
+            return key
+        if unreferenceable(value):
+            self.loosen(key, value)
+        else:
+            self.refs[key] = weakref.ref(value, lambda ref, key=key: self.forget(key))
+        return key
+
+    def define_name(self, frame: int, name: str, event: int, value: Any) -> None:
+        frame = self.scope(frame, name)
+        self.names.setdefault(frame, {})[name] = event
+        bindings = self.bindings.setdefault(frame, {})
+        if name in bindings:
+            self.release(bindings[name])
+        bindings[name] = value
+        self.hold(value)
+
+    def define_cell(self, value: Any, key: Any, event: int) -> None:
+        cells = self.cells.setdefault(self.watch(value), {})
+        cells[key] = event
+        cells[WHOLE] = event
+
+    def bound(self, frame: int, name: str) -> Any:
+        bindings = self.bindings.get(self.scope(frame, name), {})
+        if name in bindings:
+            return bindings[name]
+        return self.bindings[NO_ID].get(name)
+
+    def name_writer(self, frame: int, name: str) -> Optional[int]:
+        # names a function never wrote are its globals
+        writer = self.names.get(self.scope(frame, name), {}).get(name)
+        return writer if writer is not None else self.names[NO_ID].get(name)
+
+    def object_writers(self, value: Any) -> Tuple[int, ...]:
+        # the state of an object is every cell written on it
+        cells = self.cells.get(id(value))
+        return tuple(set(cells.values())) if cells is not None else ()
+
+    def cell_writer(self, value: Any, key: Any = WHOLE) -> Optional[int]:
+        cells = self.cells.get(id(value))
+        if cells is None:
+            return None
+        writer = cells.get(key)
+        return writer if writer is not None else cells.get(WHOLE)
+
+
+class ControlHeaders(cst.CSTVisitor):
+    """
+        Maps every line to the header lines of the if, else, for and while blocks around it, and to
+        the global and nonlocal statements before it in its function
+    """
+    METADATA_DEPENDENCIES = (
+        PositionProvider,
+    )
+    def __init__(self) -> None:
+        super().__init__()
+        self.stack: List[int] = []
+        # per function, the lines of the global and nonlocal statements seen so far
+        self.declarations: List[List[int]] = [[]]
+        self.headers: Dict[int, Tuple[int, ...]] = {}
+
+    def line(self, node: cst.CSTNode) -> int:
+        return self.get_metadata(PositionProvider, node).start.line
+
+    def enter_block(self, node: cst.CSTNode) -> None:
+        line = self.line(node)
+        self.headers[line] = (*self.stack, *self.declarations[-1])
+        self.stack.append(line)
+
+    def leave_block(self, node: cst.CSTNode) -> None:
+        self.stack.pop()
+
+    visit_If = visit_Else = visit_For = visit_While = enter_block
+    leave_If = leave_Else = leave_For = leave_While = leave_block
+
+    def visit_SimpleStatementLine(self, node: cst.SimpleStatementLine) -> None:
+        self.headers[self.line(node)] = (*self.stack, *self.declarations[-1])
+
+    def visit_FunctionDef(self, node: cst.FunctionDef) -> None:
+        self.declarations.append([])
+
+    def leave_FunctionDef(self, original_node: cst.FunctionDef) -> None:
+        self.declarations.pop()
+
+    def declare(self, node: cst.CSTNode) -> None:
+        # a kept line that writes a global still needs its declaration
+        self.declarations[-1].append(self.line(node))
+
+    visit_Global = visit_Nonlocal = declare
+
+
+def control_headers(code: str) -> Dict[int, Tuple[int, ...]]:
+    headers = ControlHeaders()
+    metadata_wrapper(code).visit(headers)
+    return headers.headers
+
+
+class ScopeDeclarations(cst.CSTVisitor):
+    """
+        Maps the line of every function to the names its global and nonlocal statements declare,
+        each with the line of the function that holds it (None for the module)
+    """
+    METADATA_DEPENDENCIES = (
+        PositionProvider,
+    )
+    def __init__(self) -> None:
+        super().__init__()
+        self.functions: List[int] = []
+        self.declarations: Dict[int, Dict[str, Optional[int]]] = {}
+
+    def visit_FunctionDef(self, node: cst.FunctionDef) -> None:
+        line = self.get_metadata(PositionProvider, node).start.line
+        self.functions.append(line)
+        self.declarations[line] = {}
+
+    def leave_FunctionDef(self, original_node: cst.FunctionDef) -> None:
+        self.functions.pop()
+
+    def visit_Global(self, node: cst.Global) -> None:
+        if self.functions:
+            self.declarations[self.functions[-1]].update((item.name.value, None) for item in node.names)
+
+    def visit_Nonlocal(self, node: cst.Nonlocal) -> None:
+        if len(self.functions) > 1:
+            self.declarations[self.functions[-1]].update((item.name.value, self.functions[-2]) for item in node.names)
+
+
+def scope_declarations(code: str) -> Dict[int, Dict[str, Optional[int]]]:
+    declarations = ScopeDeclarations()
+    metadata_wrapper(code).visit(declarations)
+    return declarations.declarations
+
+
+def declared_scopes(declarations: Dict[str, Optional[int]], running: List[Tuple[str, int, int]], dyn_ast: str) -> Dict[str, int]:
+    """
+        Resolves the names a function declares global or nonlocal to the frame that holds them:
+        the module's, or the innermost running call of the function it is nested in
+    """
+    scopes = {}
+    for name, outer in declarations.items():
+        if outer is None:
+            scopes[name] = NO_ID
+            continue
+        for file, line, frame in reversed(running):
+            if file == dyn_ast and line == outer:
+                scopes[name] = frame
+                break
+    return scopes
+
+
+def literal_key(node: cst.CSTNode) -> Any:
+    if isinstance(node, cst.Integer):
+        return node.evaluated_value
+    if isinstance(node, cst.SimpleString):
+        return node.evaluated_value
+    return WHOLE
+
+
+class ShadowTracking:
+    """
+        Hooks shared by the analyses that follow dependences through a ShadowMemory while the
+        program runs: a read depends on the write of the variable or object cell it reads, a write
+        or call on the reads of its own lines, a function's entry on its call and a return on the
+        reads of the returned value. What a location maps to is up to the subclass, which makes it
+        in store_value from an event and what the event depends on. A mixin rather than an
+        analysis, so that only its subclasses are picked up as analyses
+    """
+    def initialize_shadow(self) -> None:
+        self.shadow = ShadowMemory()
+        # stored values of the reads and calls of the running statement by line, per frame
+        self.pending: List[Dict[int, List[Any]]] = [{}]
+        # per running call: the stored value and line of its pre_call, and the object it may mutate
+        self.calls: List[Tuple[Any, int, Any]] = []
+        # (file, def line, frame) of the running calls, and the global and nonlocal names by file and def line
+        self.running: List[Tuple[str, int, int]] = []
+        self.declarations: Dict[str, Dict[int, Dict[str, Optional[int]]]] = {}
+
+    def store_value(self, kind: int, dyn_ast: str, iid: int, line: int, *dependences: Optional[Any]) -> Any:
+        """
+            Returns what the locations an event of kind defines map to, given what it depends on
+        """
+        raise NotImplementedError
+
+    def refine(self, *dependences: Optional[Any]) -> None:
+        """
+            Adds to what the last read depends on, once its attribute or subscript is known
+        """
+        raise NotImplementedError
+
+    def frame_key(self) -> int:
+        raise NotImplementedError
+
+    def enter_frame(self, value: Any) -> int:
+        raise NotImplementedError
+
+    def leave_frame(self) -> int:
+        raise NotImplementedError
+
+    def note_read(self, entry: IidEntry, value: Any, position: int) -> None:
+        pass
+
+    def note_write(self, entry: IidEntry, value: Any) -> None:
+        pass
+
+    def span(self, dyn_ast: str, iid: int) -> range:
+        location = self.iid_entry(dyn_ast, iid).location
+        return range(location.start_line, location.end_line + 1)
+
+    def consume(self, lines: range) -> List[Any]:
+        pending = self.pending[-1]
+        return [value for line in lines for value in pending.pop(line, ())]
+
+    def read(self, dyn_ast: str, iid: int, val: Any) -> Any:
+        entry = self.iid_entry(dyn_ast, iid)
+        dependences = ()
+        if entry.kind == "Name":
+            dependences = (self.shadow.name_writer(self.frame_key(), entry.name), *self.shadow.object_writers(val))
+        value = self.store_value(READ, dyn_ast, iid, entry.line, *dependences)
+        reads = self.pending[-1].setdefault(entry.line, [])
+        reads.append(value)
+        self.note_read(entry, value, len(reads) - 1)
+
+    def read_attribute(self, dyn_ast: str, iid: int, base: Any, name: str, val: Any) -> Any:
+        self.refine(self.shadow.cell_writer(base, name), self.shadow.cell_writer(val))
+
+    def read_subscript(self, dyn_ast: str, iid: int, base: Any, sl: List[Any], val: Any) -> Any:
+        key = sl[0] if len(sl) == 1 and isinstance(sl[0], (int, str)) else WHOLE
+        self.refine(self.shadow.cell_writer(base, key), self.shadow.cell_writer(val))
+
+    def enter_control_flow(self, dyn_ast: str, iid: int, condition: Any) -> Any:
+        # an if or while header ends the statement before it; its own reads are found by line
+        if self.iid_entry(dyn_ast, iid).kind in ("If", "While"):
+            self.pending[-1].clear()
+
+    def write(self, dyn_ast: str, iid: int, old_vals: List[Callable], new_val: Any) -> Any:
+        entry = self.iid_entry(dyn_ast, iid)
+        frame = self.frame_key()
+        uses = self.consume(self.span(dyn_ast, iid))
+        # whatever else is pending belongs to statements that wrote nothing
+        self.pending[-1].clear()
+        node = entry.node
+        if isinstance(node, cst.Assign):
+            targets = [target.target for target in node.targets]
+        else:
+            targets = [node.target]
+            if isinstance(node, cst.AugAssign) and isinstance(node.target, cst.Name):
+                uses.append(self.shadow.name_writer(frame, node.target.value))
+        # storing into p.x or xs[i] needs p or xs to exist
+        uses.extend(
+            self.shadow.name_writer(frame, target.value.value)
+            for target in targets
+            if isinstance(target, (cst.Attribute, cst.Subscript)) and isinstance(target.value, cst.Name)
+        )
+        value = self.store_value(WRITE, dyn_ast, iid, entry.line, *uses)
+        self.note_write(entry, value)
+        for target in targets:
+            self.define(frame, target, value, new_val if len(targets) == 1 else None)
+
+    def define(self, frame: int, target: cst.CSTNode, stored: Any, value: Any) -> None:
+        if isinstance(target, cst.Name):
+            self.shadow.define_name(frame, target.value, stored, value)
+        elif isinstance(target, (cst.Tuple, cst.List)):
+            for element in target.elements:
+                self.define(frame, element.value, stored, None)
+        elif isinstance(target, (cst.Attribute, cst.Subscript)) and isinstance(target.value, cst.Name):
+            base = self.shadow.bound(frame, target.value.value)
+            if base is None or isinstance(base, IMMUTABLE_TYPES):
+                return
+            if isinstance(target, cst.Attribute):
+                key = target.attr.value
+            else:
+                key = literal_key(target.slice[0].slice.value) if len(target.slice) == 1 and isinstance(target.slice[0].slice, cst.Index) else WHOLE
+            self.shadow.define_cell(base, key, stored)
+
+    def pre_call(self, dyn_ast: str, iid: int, function: Callable, pos_args: Tuple, kw_args: Dict):
+        line = self.iid_entry(dyn_ast, iid).line
+        value = self.store_value(PRE_CALL, dyn_ast, iid, line, *(read for span_line in self.span(dyn_ast, iid) for read in self.pending[-1].get(span_line, ())))
+        owner = getattr(function, "__self__", None)
+        # a method call may mutate the object it is called on
+        mutable = owner is not None and not isinstance(owner, IMMUTABLE_TYPES) and not isinstance(owner, type) and type(owner).__name__ != "module"
+        self.calls.append((value, line, owner if mutable else None))
+
+    def post_call(self, dyn_ast: str, iid: int, result: Any, call: Callable, pos_args: Tuple, kw_args: Dict) -> Any:
+        line = self.iid_entry(dyn_ast, iid).line
+        value = self.store_value(POST_CALL, dyn_ast, iid, line, *self.consume(self.span(dyn_ast, iid)))
+        _, _, owner = self.calls.pop() if self.calls else (None, line, None)
+        if owner is not None:
+            self.shadow.define_cell(owner, WHOLE, value)
+        self.pending[-1].setdefault(line, []).append(value)
+
+    def function_enter(self, dyn_ast: str, iid: int, args: List[Any], name: str, is_lambda: bool) -> None:
+        entry = self.iid_entry(dyn_ast, iid)
+        value = self.store_value(FUNCTION_ENTER, dyn_ast, iid, entry.line, self.calls[-1][0] if self.calls else None)
+        frame = self.enter_frame(value)
+        self.pending.append({})
+        declarations = self.declarations.get(dyn_ast)
+        if declarations is None:
+            self.read_source_file()
+            # an index handed in through iid_indices is the sliced source's
+            declarations = self.declarations[dyn_ast] = scope_declarations(self.sources.get(dyn_ast, self.source))
+        self.shadow.enter(frame, declared_scopes(declarations.get(entry.line, {}), self.running, dyn_ast))
+        self.running.append((dyn_ast, entry.line, frame))
+        node = entry.node
+        if isinstance(node, cst.FunctionDef):
+            for param, argument in zip(node.params.params, args):
+                # parameters arrive as lambdas that read them
+                self.shadow.define_name(frame, param.name.value, value, argument())
+
+    def function_exit(self, dyn_ast: str, iid: int, function_name: str, result: Any) -> Any:
+        if len(self.pending) > 1:
+            line = self.iid_entry(dyn_ast, iid).line
+            value = self.store_value(FUNCTION_EXIT, dyn_ast, iid, line, *(read for reads in self.pending.pop().values() for read in reads))
+            self.shadow.leave(self.leave_frame())
+            if self.running:
+                self.running.pop()
+            # the caller's call uses the returned value
+            self.pending[-1].setdefault(self.calls[-1][1] if self.calls else line, []).append(value)
+
+
+class DefUseSlice(ShadowTracking, RecordTrace):
+    """
+        Links every read to its reaching definition through a ShadowMemory while the program runs,
+        so that the slice is a walk over def-use edges. Every location maps to the event that last
+        wrote it, and names reused in different scopes or objects are kept apart
+    """
+    def __init__(self, source, criterion: Optional[Tuple[int, Optional[Set[str]]]] = None, code: Optional[str] = None):
+        super().__init__(source)
+        self.criterion = criterion
+        self.source = code
+        self.line_numbers = set()
+        self.slice_criteria = set()
+        self.initialize_shadow()
+        self.last_read = NO_ID
+        self.uses: Dict[int, Tuple[int, ...]] = {}
+
+    def record(self, kind: int, dyn_ast: str, iid: int) -> int:
+        # every event is a node of the graph, with or without dependences
+        event = super().record(kind, dyn_ast, iid)
+        self.uses[event] = ()
+        return event
+
+    def depend(self, event: int, *writers: Optional[int]) -> None:
+        # everything a function does depends on the call that entered it
+        frame = self.frames[-1]
+        self.uses[event] = tuple(writer for writer in writers if writer is not None) + ((frame,) if frame != NO_ID else ())
+
+    def store_value(self, kind: int, dyn_ast: str, iid: int, line: int, *dependences: Optional[int]) -> int:
+        event = self.record(kind, dyn_ast, iid)
+        self.depend(event, *dependences)
+        return event
+
+    def refine(self, *dependences: Optional[int]) -> None:
+        self.depend(self.last_read, *dependences)
+
+    def frame_key(self) -> int:
+        return self.frames[-1]
+
+    def enter_frame(self, value: int) -> int:
+        self.frames.append(value)
+        return value
+
+    def leave_frame(self) -> int:
+        return self.frames.pop()
+
+    def note_read(self, entry: IidEntry, value: int, position: int) -> None:
+        self.last_read = value
+
+    def graph(self) -> DependenceGraph:
+        return DependenceGraph.from_def_use(self.trace, self.uses)
+
+    def read_source_file(self) -> None:
+        if self.source is None:
+            with open(self.args, "r") as file:
+                self.source = file.read()
+
+    def slice_lines(self, line: int, variables: Optional[Set[str]] = None) -> Set[int]:
+        """
+            Returns the lines of every event the variables on line transitively depend on,
+            with the headers of the blocks around them and what their conditions read
+        """
+        self.read_source_file()
+        graph = self.graph()
+        headers = control_headers(self.source)
+        reads: Dict[int, List[int]] = {}
+        seeds = []
+        for first, (kinds, _iids, event_lines, _frames, _names, _files) in self.trace.chunks():
+            for offset, kind in enumerate(kinds):
+                event, event_line = first + offset, event_lines[offset]
+                if kind == READ:
+                    reads.setdefault(event_line, []).append(event)
+                # the criterion starts from the reads of its variables, or their writes on its line
+                if event_line == line and kind in (READ, WRITE) and (variables is None or self.trace.name(event) in variables):
+                    seeds.append(event)
+        lines = {line}
+        worklist = [line, *graph.reachable_lines(seeds)]
+        while worklist:
+            kept = worklist.pop()
+            lines.add(kept)
+            for header in headers.get(kept, ()):
+                if header not in lines:
+                    lines.add(header)
+                    worklist.append(header)
+                    seeds.extend(reads.get(header, ()))
+                    worklist.extend(graph.reachable_lines(reads.get(header, ())) - lines)
+        relevant = graph.reachable(seeds)
+        self.slice_criteria = set(variables or ()) | {
+            self.trace.name(event) for event in relevant if self.trace.kind(event) == READ
+        } - {None}
+        return lines
+
+    def slice_code(self) -> str:
+        self.read_source_file()
+        if self.criterion is None:
+            variables, line = slicing_criterion(self.source)
+        else:
+            line, variables = self.criterion
+            if variables is None:
+                variables = slicing_criterion_at(self.source, line)
+        self.line_numbers = self.slice_lines(line, set(variables))
+        return remove_lines(self.source, self.line_numbers)
+
+    def end_execution(self) -> None:
+        sliced_code = self.slice_code()
+        with open(os.path.join(os.path.dirname(self.args), "sliced.py"), "w") as file:
+            file.write(sliced_code)
+
+
+def bit_lines(bits: int) -> Set[int]:
+    lines = set()
+    while bits:
+        low = bits & -bits
+        lines.add(low.bit_length() - 1)
+        bits ^= low
+    return lines
+
+
+class ForwardSlice(ShadowTracking, BaseAnalysis):
+    """
+        Computes the slice of a criterion known before the run, forward: the ShadowMemory maps every
+        location to the bitset (an int indexed by line) of the lines its value depends on, and each
+        write stores the union of the bitsets it reads. Nothing is recorded, so memory grows with the
+        live locations and the program length, not with the run; the edges are those of DefUseSlice
+    """
+    def __init__(self, source, criterion: Optional[Tuple[int, Optional[Set[str]]]] = None, code: Optional[str] = None):
+        super().__init__()
+        self.args = source
+        self.source = code
+        self.read_source_file()
+        if criterion is None:
+            variables, self.slicing_criterion_location = slicing_criterion(self.source)
+        else:
+            self.slicing_criterion_location, variables = criterion
+            if variables is None:
+                variables = slicing_criterion_at(self.source, self.slicing_criterion_location)
+        self.slice_criteria = set(variables)
+        self.line_numbers = set()
+        self.iid_indices = {}
+        self.sources = {}
+        self.initialize_shadow()
+        # bitsets of the running calls: (entry, frame id)
+        self.frames: List[Tuple[int, int]] = [(0, NO_ID)]
+        self.entered = 0
+        # what the last read depends on, where it is pending and whether the criterion reads it
+        self.last_read: Tuple[int, int, bool] = (NO_ID, NO_ID, False)
+        # per line, what all of its reads depend on and the names they read
+        self.line_reads: Dict[int, int] = {}
+        self.line_names: Dict[int, Set[str]] = {}
+        self.criterion_bits = 0
+
+    def read_source_file(self) -> None:
+        if self.source is None:
+            with open(self.args, "r") as file:
+                self.source = file.read()
+
+    def iid_entry(self, dyn_ast: str, iid: int) -> IidEntry:
+        index = self.iid_indices.get(dyn_ast)
+        if index is None:
+            with open(dyn_ast, "r") as file:
+                self.sources[dyn_ast] = file.read()
+            index = self.iid_indices[dyn_ast] = iid_index(self.sources[dyn_ast], iid_locations(dyn_ast))
+        return index[iid]
+
+    def bits(self, line: int, *dependences: Optional[int]) -> int:
+        bits = (1 << line) | self.frames[-1][0]
+        for dependence in dependences:
+            if dependence is not None:
+                bits |= dependence
+        return bits
+
+    def store_value(self, kind: int, dyn_ast: str, iid: int, line: int, *dependences: Optional[int]) -> int:
+        return self.bits(line, *dependences)
+
+    def frame_key(self) -> int:
+        return self.frames[-1][1]
+
+    def enter_frame(self, value: int) -> int:
+        self.entered += 1
+        self.frames.append((value, self.entered))
+        return self.entered
+
+    def leave_frame(self) -> int:
+        return self.frames.pop()[1]
+
+    def add_read(self, line: int, bits: int, relevant: bool) -> None:
+        self.line_reads[line] = self.line_reads.get(line, 0) | bits
+        if relevant:
+            self.criterion_bits |= bits
+
+    def note_read(self, entry: IidEntry, value: int, position: int) -> None:
+        if entry.kind == "Name":
+            self.line_names.setdefault(entry.line, set()).add(entry.name)
+        relevant = entry.line == self.slicing_criterion_location and entry.name in self.slice_criteria
+        self.last_read = (entry.line, position, relevant)
+        self.add_read(entry.line, value, relevant)
+
+    def note_write(self, entry: IidEntry, value: int) -> None:
+        if entry.line == self.slicing_criterion_location and entry.name in self.slice_criteria:
+            self.criterion_bits |= value
+
+    def refine(self, *dependences: Optional[int]) -> None:
+        line, position, relevant = self.last_read
+        reads = self.pending[-1].get(line)
+        if reads is None or position >= len(reads):
+            return
+        bits = reads[position] = self.bits(line, reads[position], *dependences)
+        self.add_read(line, bits, relevant)
+
+    def slice_code(self) -> str:
+        """
+            Returns the program sliced for the criterion, from the lines it was found to depend on
+            and the headers of the blocks around them
+        """
+        headers = control_headers(self.source)
+        lines = {self.slicing_criterion_location}
+        worklist = [self.slicing_criterion_location, *bit_lines(self.criterion_bits)]
+        while worklist:
+            kept = worklist.pop()
+            lines.add(kept)
+            for header in headers.get(kept, ()):
+                if header not in lines:
+                    lines.add(header)
+                    worklist.append(header)
+                    worklist.extend(bit_lines(self.line_reads.get(header, 0)) - lines)
+        self.line_numbers = lines
+        for line in lines:
+            self.slice_criteria.update(self.line_names.get(line, ()))
+        return remove_lines(self.source, self.line_numbers)
+
+    def end_execution(self) -> None:
+        sliced_code = self.slice_code()
+        with open(os.path.join(os.path.dirname(self.args), "sliced.py"), "w") as file:
+            file.write(sliced_code)
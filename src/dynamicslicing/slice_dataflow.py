@@ -1,28 +1,18 @@
 import libcst as cst
 from dynapyt.analyses.BaseAnalysis import BaseAnalysis
-from dynapyt.instrument.IIDs import IIDs
-from dynamicslicing.utils import slicing_criterion, remove_lines, class_information
-from typing import List, Callable, Any, Tuple, Dict
-from dynapyt.utils.nodeLocator import get_node_by_location
-import os
-
-class SliceDataflow(BaseAnalysis):
-    def __init__(self, source):
-        super().__init__()
-        self.args = source
-        self.initialize_slice_data()
-    
-    def initialize_slice_data(self):
-        self.read_source_file()
-        self.extract_slice_criteria()
-
-    def read_source_file(self):
-        file_name = f"{self.args}"
-        with open(file_name, "r") as file:
-            self.source = file.read()
+from dynamicslicing.events import EventProcessing
+from dynamicslicing.utils import IidEntry, slicing_criterion, slicing_criterion_at, remove_lines, class_information
+from typing import Any, Tuple
 
+class SliceDataflow(EventProcessing, BaseAnalysis):
     def extract_slice_criteria(self):
-        set_slice_criterion = slicing_criterion(self.source)
+        if self.criterion is None:
+            set_slice_criterion = slicing_criterion(self.source)
+        else:
+            line, variables = self.criterion
+            if variables is None:
+                variables = slicing_criterion_at(self.source, line)
+            set_slice_criterion = (set(variables), line)
         self.slice_criteria = set_slice_criterion[0]
         split_criteria = set()
         for criteria in self.slice_criteria:
@@ -31,138 +21,82 @@ class SliceDataflow(BaseAnalysis):
         self.slice_criteria.update(split_criteria)
         self.slicing_criterion_location = set_slice_criterion[1]
         self.dependencies = set()
-        self.node_dict = {}
-        self.line_numbers = []
+        self.initialize_events()
+        self.line_numbers = set()
         class_info = class_information(self.source)
         if class_info:
-            self.line_numbers.extend(class_info)
+            self.line_numbers.update(class_info)
         
-    def add_node_to_dependencies(self, node: Any, location: int, type: str):
-        if location not in self.line_numbers:
-            self.node_dict[location] = {type: node}
+    def state(self) -> Tuple[int, int, int]:
+        # the sets only grow, so their sizes change whenever the state does
+        return len(self.line_numbers), len(self.dependencies), len(self.slice_criteria)
+
+    def add_node_to_dependencies(self, node: Any, location: int):
         if isinstance(node, cst.Name):
             if node.value in self.slice_criteria and location not in self.line_numbers:
-                self.line_numbers.append(location)
+                self.line_numbers.add(location)
                 self.dependencies.add(node)
         elif isinstance(node, cst.Assign):
             if isinstance(node.targets[0].target.value, cst.Name) and node.targets[0].target.value.value in self.slice_criteria and location not in self.line_numbers:
-                self.line_numbers.append(location)
+                self.line_numbers.add(location)
                 self.dependencies.add(node)
             elif node.targets[0].target.value in self.slice_criteria and location not in self.line_numbers:
-                self.line_numbers.append(location)
+                self.line_numbers.add(location)
                 self.dependencies.add(node)
         elif isinstance(node, cst.AugAssign):
             if node.target.value in self.slice_criteria and location not in self.line_numbers:
-                self.line_numbers.append(location)
+                self.line_numbers.add(location)
                 self.dependencies.add(node)
     
-    def read(self, dyn_ast: str, iid: int, val: Any) -> Any:
-        location = self.iid_to_location(dyn_ast, iid)
-        node = get_node_by_location(self._get_ast(dyn_ast)[0], location)
+    def on_read(self, entry: IidEntry, event: int) -> None:
+        location, node = entry[:2]
         if location.start_line == self.slicing_criterion_location:
-            self.add_node_to_dependencies(node, location.start_line, "read")
+            self.add_node_to_dependencies(node, location.start_line)
     
-    def write(
-        self, dyn_ast: str, iid: int, old_vals: List[Callable], new_val: Any
-    ) -> Any:
-        location = self.iid_to_location(dyn_ast, iid)
-        node = get_node_by_location(self._get_ast(dyn_ast)[0], location)
+    def on_write(self, entry: IidEntry, event: int) -> None:
+        location, node = entry[:2]
         if isinstance(node, cst.Assign) and node.targets[0].target.value in self.slice_criteria:
             if hasattr(node.value, "parts") and isinstance(node.value.parts[0], cst.FormattedStringExpression):
                 self.slice_criteria.add(node.value.parts[0].expression.value.value)
-        if location.start_line <= self.slicing_criterion_location:
-            self.add_node_to_dependencies(node, location.start_line, "write")
         
-    def post_call(
-        self,
-        dyn_ast: str,
-        iid: int,
-        result: Any,
-        call: Callable,
-        pos_args: Tuple,
-        kw_args: Dict,
-    ) -> Any:
-        location = self.iid_to_location(dyn_ast, iid)
-        node = get_node_by_location(self._get_ast(dyn_ast)[0], location)
+    def on_post_call(self, entry: IidEntry, event: int) -> None:
+        location, node = entry[:2]
         if location.start_line not in self.line_numbers:
-            self.node_dict[location.start_line] = {"post_call": node}
             if node.func.value in self.slice_criteria:
-                self.line_numbers.append(location.start_line)
+                self.line_numbers.add(location.start_line)
                 self.dependencies.add(node)
     
-    def function_enter(
-        self, dyn_ast: str, iid: int, args: List[Any], name: str, is_lambda: bool
-    ) -> None:
-        location = self.iid_to_location(dyn_ast, iid)
-        node = get_node_by_location(self._get_ast(dyn_ast)[0], location)
-        
+    def on_function_enter(self, entry: IidEntry, event: int) -> None:
+        location, node = entry[:2]
         if location.start_line not in self.line_numbers:
-            self.node_dict[location.start_line] = {"function_enter": node}
-            self.line_numbers.append(location.start_line)
+            self.line_numbers.add(location.start_line)
             self.dependencies.add(node)
     
-    def pre_call(
-        self, dyn_ast: str, iid: int, function: Callable, pos_args: Tuple, kw_args: Dict
-    ):
-        location = self.iid_to_location(dyn_ast, iid)
-        node = get_node_by_location(self._get_ast(dyn_ast)[0], location)
+    def on_pre_call(self, entry: IidEntry, event: int) -> None:
+        location, node = entry[:2]
         func_value, func_attr = '', ''
         if location.start_line not in self.line_numbers:
             if isinstance(node.func, cst.Attribute):
                 if node.func.attr.value == "append" and node.func.value.value in self.slice_criteria:
-                    self.node_dict[location.start_line] = {"pre_call": node}
-                    self.line_numbers.append(location.start_line)
+                    self.line_numbers.add(location.start_line)
                     self.dependencies.add(node)
             if len(node.args) == 0:
-                self.node_dict[location.start_line] = {"pre_call": node}
-                self.line_numbers.append(location.start_line)
+                self.line_numbers.add(location.start_line)
                 self.dependencies.add(node)
     
-    def get_value(self, node) -> str:
-        if isinstance(node, cst.Name):
-            return node.value
-        elif isinstance(node, cst.Assign):
-            if isinstance(node.value, cst.Comparison):
-                if isinstance(node.targets[0], cst.AssignTarget):
-                    return node.targets[0].target.value
-                return node.value.left.value.value
-            if isinstance(node.targets[0], cst.AssignTarget):
-                if hasattr(node.targets[0].target, "value") and hasattr(node.targets[0].target.value, "value"): 
-                    if node.targets[0].target.value.value in self.slice_criteria or node.targets[0].target.attr.value in self.slice_criteria:
-                        if hasattr(node.value, "value") and hasattr(node.value.value, "value"):
-                            self.slice_criteria.add(node.value.value.value)
-                            return node.targets[0].target.value.value
-            temp = node.targets[0].target
-            if isinstance(temp, cst.Attribute):
-                return temp.attr.value       
-            return node.targets[0].target.value
-        elif isinstance(node, cst.AugAssign):
-            return node.target.value
-        elif isinstance(node, cst.Call):
-            if isinstance(node.func, cst.Attribute) and node.func.value.value in self.slice_criteria and node.func.attr.value == "append":
-                if len(node.args) > 0:
-                    self.slice_criteria.add(node.args[0].value.value)
-                    return node.args[0].value.value
-    
-    def end_execution(self) -> None:
-        reverse_sorted_dict = dict(sorted(self.node_dict.items(), reverse = True))
-        for outer_key, inner_dict in reverse_sorted_dict.items():
-            for inner_key, value in inner_dict.items():
-                line_number = outer_key
-                dtype = inner_key
-                node = value
-                temp = self.get_value(node)
-                if temp in self.slice_criteria and line_number not in self.line_numbers and dtype != "read" and line_number <= self.slicing_criterion_location:
-                    self.line_numbers.append(line_number)
-                    if isinstance(node.value, cst.BinaryOperation):
-                        self.slice_criteria.add(node.value.left.value)
-                        self.slice_criteria.add(node.value.right.value)
+    def slice_code(self) -> str:
+        self.drain()
+        with self.profiler.phase("dependence graph"):
+            if self.dependence_graph is None:
+                self.dependence_graph = self.builder.graph(self.event_node)
+        with self.profiler.phase("backward pass"):
+            relevant = self.dependence_graph.backward_slice(self.slice_criteria, self.slicing_criterion_location)
+            self.slice_criteria.update(self.dependence_graph.used_names(relevant))
+        for event in relevant:
+            self.line_numbers.add(self.trace.line(event))
         # weird check
-        if self.slicing_criterion_location not in self.line_numbers:
-            self.line_numbers.append(self.slicing_criterion_location)
-        sliced_code = remove_lines(self.source, self.line_numbers)
-        output_file_name = os.path.join(os.path.dirname(self.args), "sliced.py")
-        with open(output_file_name, "w") as output_file:
-            output_file.write(sliced_code)
+        self.line_numbers.add(self.slicing_criterion_location)
+        with self.profiler.phase("remove lines"):
+            return remove_lines(self.source, self.line_numbers)
         # return self.source, self.line_numbers, self.slice_criteria
         
\ No newline at end of file
@@ -0,0 +1,291 @@
+from array import array
+from bisect import bisect_right
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import weakref
+
+# event kinds, stored as one byte per event; an if condition is recorded as the outcome it evaluated to
+READ, WRITE, PRE_CALL, POST_CALL, FUNCTION_ENTER, FUNCTION_EXIT, BRANCH_TAKEN, BRANCH_NOT_TAKEN = range(8)
+EVENT_KINDS = ("read", "write", "pre_call", "post_call", "function_enter", "function_exit", "branch_taken", "branch_not_taken")
+
+# id used for events without a variable name and for code running outside any function
+NO_ID = -1
+
+Event = Tuple[int, int, int, int, int, int]
+
+TRACE_MAGIC = b"DSTRACE1"
+
+# typecodes of the kind, iid, line, frame, name and file columns
+COLUMN_TYPES = "biiiii"
+EVENT_SIZE = sum(array(typecode).itemsize for typecode in COLUMN_TYPES)
+
+# bytes of events kept in memory before the recorder spills them to disk, unset means unbounded
+MEMORY_LIMIT_VARIABLE = "DYNAMICSLICING_TRACE_MEMORY"
+
+# raw hook events the live analyses buffer before processing them in one batch
+RING_CAPACITY = 4096
+
+
+def default_memory_limit() -> Optional[int]:
+    limit = os.environ.get(MEMORY_LIMIT_VARIABLE)
+    return int(limit) if limit else None
+
+
+def remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class EventRing:
+    """
+        Preallocated buffer of raw hook events (kind, iid, file). The live analyses only fill it while
+        the program runs, and process the events in one batch when it is full or execution ends
+    """
+    def __init__(self, capacity: int = RING_CAPACITY) -> None:
+        self.capacity = capacity
+        self.size = 0
+        self.kinds = array("b", bytes(capacity))
+        self.iids = array("i", bytes(4 * capacity))
+        self.files: List[Optional[str]] = [None] * capacity
+
+    def push(self, kind: int, iid: int, file: str) -> bool:
+        """
+            Buffers one event and returns whether the buffer is full
+        """
+        i = self.size
+        self.kinds[i] = kind
+        self.iids[i] = iid
+        self.files[i] = file
+        self.size = i + 1
+        return self.size == self.capacity
+
+    def events(self) -> Iterator[Tuple[int, int, str]]:
+        return zip(memoryview(self.kinds)[:self.size], memoryview(self.iids)[:self.size], self.files)
+
+    def clear(self) -> None:
+        self.size = 0
+
+
+class TraceRecorder:
+    """
+        Records every runtime event (kind, iid, line, frame id, variable-name id, file id) in
+        preallocated typed arrays that double in size when full. With a memory limit the arrays
+        have a fixed size instead, and every full chunk is spilled to a local file that is read
+        back through mmap
+    """
+    def __init__(self, capacity: int = 1024, memory_limit: Optional[int] = None, spill_dir: Optional[str] = None) -> None:
+        if memory_limit is None:
+            memory_limit = default_memory_limit()
+        self.memory_limit = memory_limit
+        if memory_limit:
+            capacity = max(memory_limit // EVENT_SIZE, 1)
+        self.spill_dir = spill_dir
+        self.size = 0
+        self.capacity = capacity
+        self.kinds = array("b", bytes(capacity))
+        self.iids = array("i", bytes(4 * capacity))
+        self.lines = array("i", bytes(4 * capacity))
+        self.frames = array("i", bytes(4 * capacity))
+        self.names = array("i", bytes(4 * capacity))
+        self.files = array("i", bytes(4 * capacity))
+        self.name_table: List[str] = []
+        self.name_ids: Dict[str, int] = {}
+        self.file_table: List[str] = []
+        self.file_ids: Dict[str, int] = {}
+        # events stored on disk come first: (path, first event, number of events, byte offset) per chunk
+        self.spilled = 0
+        self.segments: List[Tuple[str, int, int, int]] = []
+        self.segment_starts: List[int] = []
+        self.spill_path: Optional[str] = None
+        self.mappings: Dict[str, mmap.mmap] = {}
+
+    def columns(self) -> Tuple[array, ...]:
+        return self.kinds, self.iids, self.lines, self.frames, self.names, self.files
+
+    def grow(self) -> None:
+        extra = max(self.capacity, 1)
+        for column in self.columns():
+            column.frombytes(bytes(column.itemsize * extra))
+        self.capacity += extra
+
+    def spill(self) -> None:
+        """
+            Appends the buffered events to the spill file as one chunk and empties the buffer
+        """
+        if self.size == 0:
+            return
+        if self.spill_path is None:
+            descriptor, self.spill_path = tempfile.mkstemp(prefix="dynamicslicing-", suffix=".trace", dir=self.spill_dir)
+            os.close(descriptor)
+            weakref.finalize(self, remove_file, self.spill_path)
+        with open(self.spill_path, "ab") as file:
+            offset = file.tell()
+            for column in self.columns():
+                file.write(memoryview(column)[:self.size])
+        self.add_segment(self.spill_path, self.size, offset)
+        self.size = 0
+        # the file grew, so it is mapped again on the next read
+        self.mappings.pop(self.spill_path, None)
+
+    def add_segment(self, path: str, count: int, offset: int) -> None:
+        self.segments.append((path, self.spilled, count, offset))
+        self.segment_starts.append(self.spilled)
+        self.spilled += count
+
+    def mapping(self, path: str) -> mmap.mmap:
+        mapping = self.mappings.get(path)
+        if mapping is None:
+            with open(path, "rb") as file:
+                mapping = self.mappings[path] = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return mapping
+
+    def segment_columns(self, path: str, count: int, offset: int) -> Tuple[Sequence[int], ...]:
+        view = memoryview(self.mapping(path))
+        columns = []
+        for typecode in COLUMN_TYPES:
+            end = offset + count * array(typecode).itemsize
+            columns.append(view[offset:end].cast(typecode))
+            offset = end
+        return tuple(columns)
+
+    def chunks(self) -> Iterator[Tuple[int, Tuple[Sequence[int], ...]]]:
+        """
+            Yields the index of the first event and the columns of every chunk, in trace order:
+            the chunks on disk as views of their mapping, then the events still in memory
+        """
+        for path, first, count, offset in self.segments:
+            yield first, self.segment_columns(path, count, offset)
+        yield self.spilled, tuple(memoryview(column)[:self.size] for column in self.columns())
+
+    def value(self, column: int, i: int) -> int:
+        if i >= self.spilled:
+            return self.columns()[column][i - self.spilled]
+        path, first, count, offset = self.segments[bisect_right(self.segment_starts, i) - 1]
+        for typecode in COLUMN_TYPES[:column]:
+            offset += count * array(typecode).itemsize
+        typecode = COLUMN_TYPES[column]
+        return struct.unpack_from(typecode, self.mapping(path), offset + (i - first) * array(typecode).itemsize)[0]
+
+    def name_id(self, name: Optional[str]) -> int:
+        if name is None:
+            return NO_ID
+        name_id = self.name_ids.get(name)
+        if name_id is None:
+            name_id = self.name_ids[name] = len(self.name_table)
+            self.name_table.append(name)
+        return name_id
+
+    def file_id(self, file: str) -> int:
+        file_id = self.file_ids.get(file)
+        if file_id is None:
+            file_id = self.file_ids[file] = len(self.file_table)
+            self.file_table.append(file)
+        return file_id
+
+    def append(self, kind: int, iid: int, line: int, frame: int, name: Optional[str], file: str) -> int:
+        """
+            Records one event and returns its index in the trace
+        """
+        if self.size == self.capacity:
+            if self.memory_limit:
+                self.spill()
+            else:
+                self.grow()
+        i = self.size
+        self.kinds[i] = kind
+        self.iids[i] = iid
+        self.lines[i] = line
+        self.frames[i] = frame
+        self.names[i] = self.name_id(name)
+        self.files[i] = self.file_id(file)
+        self.size += 1
+        return self.spilled + i
+
+    def kind(self, i: int) -> int:
+        return self.value(0, i)
+
+    def iid(self, i: int) -> int:
+        return self.value(1, i)
+
+    def line(self, i: int) -> int:
+        return self.value(2, i)
+
+    def event(self, i: int) -> Event:
+        return tuple(self.value(column, i) for column in range(len(COLUMN_TYPES)))
+
+    def name(self, i: int) -> Optional[str]:
+        name_id = self.value(4, i)
+        return None if name_id == NO_ID else self.name_table[name_id]
+
+    def file(self, i: int) -> str:
+        return self.file_table[self.value(5, i)]
+
+    def nbytes(self) -> int:
+        """
+            Returns the bytes held in memory by the event columns, spilled chunks excluded
+        """
+        return sum(column.itemsize * self.capacity for column in self.columns())
+
+    def __len__(self) -> int:
+        return self.spilled + self.size
+
+    def __iter__(self) -> Iterator[Event]:
+        for _first, columns in self.chunks():
+            yield from zip(*columns)
+
+    def __reversed__(self) -> Iterator[Event]:
+        for i in range(len(self) - 1, -1, -1):
+            yield self.event(i)
+
+    def save(self, path: str, metadata: Dict[str, Any]) -> None:
+        """
+            Writes the trace as a json header followed by the raw event columns
+        """
+        header = json.dumps({
+            "size": len(self),
+            "byteorder": sys.byteorder,
+            "names": self.name_table,
+            "files": self.file_table,
+            "metadata": metadata,
+        }).encode()
+        chunks = [columns for _first, columns in self.chunks()]
+        with open(path, "wb") as file:
+            file.write(TRACE_MAGIC)
+            file.write(struct.pack("<Q", len(header)))
+            file.write(header)
+            for column in range(len(COLUMN_TYPES)):
+                for columns in chunks:
+                    file.write(columns[column])
+
+    @classmethod
+    def load(cls, path: str, memory_limit: Optional[int] = None) -> Tuple["TraceRecorder", Dict[str, Any]]:
+        """
+            Reads a trace written by save. The events stay in the file and are read through mmap,
+            unless the file was written on a machine with a different byte order
+        """
+        with open(path, "rb") as file:
+            if file.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+                raise ValueError(f"{path} is not a dynamicslicing trace")
+            header_size = struct.unpack("<Q", file.read(8))[0]
+            header = json.loads(file.read(header_size))
+            trace = cls(0, memory_limit=memory_limit)
+            if header["byteorder"] == sys.byteorder:
+                trace.add_segment(path, header["size"], file.tell())
+            else:
+                trace.size = trace.capacity = header["size"]
+                for column in trace.columns():
+                    del column[:]
+                    column.fromfile(file, header["size"])
+                    column.byteswap()
+        trace.name_table = header["names"]
+        trace.name_ids = {name: i for i, name in enumerate(trace.name_table)}
+        trace.file_table = header["files"]
+        trace.file_ids = {file: i for i, file in enumerate(trace.file_table)}
+        return trace, header["metadata"]
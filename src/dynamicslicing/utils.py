@@ -1,12 +1,25 @@
 from typing import List, Union, Optional, Dict
+from collections import namedtuple, OrderedDict
+import hashlib
 import libcst as cst
 from libcst._flatten_sentinel import FlattenSentinel
 from libcst._nodes.statement import BaseStatement, If
 from libcst.metadata import (
+    CodeRange,
     ParentNodeProvider,
     PositionProvider,
 )
 import libcst.matchers as m
+from dynapyt.instrument.IIDs import Location
+
+
+IidEntry = namedtuple("IidEntry", ["location", "node", "line", "kind", "name"])
+
+
+# parsed modules (with their resolved metadata) keyed by source hash, shared by all passes below
+MAX_CACHED_MODULES = 8
+_module_cache = OrderedDict()
+_structure_cache = OrderedDict()
 
 
 class OddIfNegation(m.MatcherDecoratableTransformer):
@@ -98,6 +111,7 @@ class SlicingCriterionLocation(cst.CSTTransformer):
     def __init__(self):
         super().__init__()
         self.slicing_criterion_location = None
+        self.slicing_criterion_locations = []
        
     def leave_Comment(
         self, original_node: "Comment", updated_node: "Comment"
@@ -105,6 +119,7 @@ class SlicingCriterionLocation(cst.CSTTransformer):
         location = self.get_metadata(PositionProvider, original_node)
         if "# slicing criterion" in original_node.value:
             self.slicing_criterion_location = int(location.start.line)
+            self.slicing_criterion_locations.append(int(location.start.line))
         return original_node
     
     def get_slicing_criterion_location(self):
@@ -155,49 +170,80 @@ class SlicingCriterion(cst.CSTTransformer):
             self.collect_variables(node.left)
             self.collect_variables(node.right)
     
-class GetClassInformation(cst.CSTTransformer):
+class ProgramStructure(cst.CSTVisitor):
     """ 
-    Returns the class information
+    Collects the class ranges and the if/else and while facts in a single read-only pass
     """
     METADATA_DEPENDENCIES = (
         PositionProvider,
-        ParentNodeProvider,
     ) 
     def __init__(self) -> None:
         super().__init__()
-        self.class_location = []
-        
+        self.class_location = set()
+        # (kind, node, location) in the order the transformers used to leave them
+        self.if_events = []
+        self.while_events = []
+        # line -> line of the innermost if or while whose condition decides whether it runs
+        self.branch_headers: Dict[int, Optional[int]] = {}
+        self.headers: List[Optional[int]] = [None]
+
+    def on_visit(self, node: cst.CSTNode) -> bool:
+        if isinstance(node, (cst.SimpleStatementLine, cst.BaseCompoundStatement)):
+            location = self.get_metadata(PositionProvider, node)
+            # a compound statement claims its header line, the statements of its body their own lines
+            end = location.end.line if isinstance(node, cst.SimpleStatementLine) else location.start.line
+            for line in range(location.start.line, end + 1):
+                self.branch_headers.setdefault(line, self.headers[-1])
+            if isinstance(node, (cst.If, cst.While)):
+                self.headers.append(location.start.line)
+            elif isinstance(node, cst.FunctionDef):
+                # a body runs when its function is called, not when the def is reached
+                self.headers.append(None)
+        return super().on_visit(node)
+
+    def on_leave(self, original_node: cst.CSTNode) -> None:
+        if isinstance(original_node, (cst.If, cst.While, cst.FunctionDef)):
+            self.headers.pop()
+        super().on_leave(original_node)
+
     def visit_ClassDef(self, node: "ClassDef") -> None:
         location = self.get_metadata(PositionProvider, node)
-        self.class_location.extend(range(int(location.start.line),int(location.end.line)+1))
+        self.class_location.update(range(int(location.start.line),int(location.end.line)+1))
+
+    def leave_If(self, original_node: "If") -> None:
+        self.if_events.append(("if", original_node, self.get_metadata(PositionProvider, original_node)))
+
+    def leave_Else_body(self, node: "Else") -> None:
+        self.if_events.append(("else", node, self.get_metadata(PositionProvider, node)))
+
+    def leave_While(self, original_node: "While") -> None:
+        self.while_events.append((original_node, self.get_metadata(PositionProvider, original_node)))
         
     def class_info(self):
         return self.class_location
 
-class GetIfInformation(cst.CSTTransformer):
+class GetIfInformation:
     """
-    Returns the if information
+    Returns the if information from the if/else events of a ProgramStructure
     """
     
-    METADATA_DEPENDENCIES = (
-        PositionProvider,
-        ParentNodeProvider,
-    )
-    
-    def __init__(self, slicing_criterion: set, write_values: Dict) -> None:
-        super().__init__()
-        self.if_information = []
+    def __init__(self, slicing_criterion: set, branch_outcomes: Optional[Dict] = None) -> None:
+        self.if_information = set()
         self.slicing_criterion = slicing_criterion
-        self.write_values = write_values
-        self.remove_information = []
-        self.bad_ifs = []
+        self.branch_outcomes = branch_outcomes or {}
+        self.remove_information = set()
+        self.bad_ifs = set()
         self.else_required = False
         self.if_required = False
         
-    def leave_If(
-        self, original_node: "If", updated_node: "If"
-    ) -> Union["BaseStatement", FlattenSentinel["BaseStatement"], cst.RemovalSentinel]:
-        location = self.get_metadata(PositionProvider, original_node)
+    def replay(self, if_events: List) -> None:
+        for kind, node, location in if_events:
+            if kind == "if":
+                self.leave_If(node, location)
+            else:
+                self.leave_Else_body(node, location)
+
+    def leave_If(self, original_node: "If", location: CodeRange) -> None:
         # In case else is required add the Comparision vars to list of slicing_criterions
         if self.else_required:
             if isinstance(original_node.test, cst.Comparison) and original_node.test.left.value not in self.slicing_criterion:
@@ -208,8 +254,9 @@ class GetIfInformation(cst.CSTTransformer):
                 if original_node.test.right.left.value not in self.slicing_criterion:
                     self.slicing_criterion.add(original_node.test.right.left.value)
 
-        evaluator = IfConditionEvaluator(self.write_values)
-        result = True if evaluator.evaluate_if_condition(original_node) not in {True, False} else evaluator.evaluate_if_condition(original_node)
+        outcome = self.branch_outcomes.get((location.start.line, location.start.column, location.end.line, location.end.column))
+        # recorded while the program ran: the branch matters if it was ever taken, an if that never ran has no outcome
+        result = outcome is not None and outcome[0] > 0
         if result or self.else_required:
             # Perform check for If condition and add vals to slicing_criterion as needed
             if isinstance(original_node.body.body[0], cst.SimpleStatementLine):
@@ -229,7 +276,7 @@ class GetIfInformation(cst.CSTTransformer):
                         else: value = body.targets[0].target.value
                     if value in self.slicing_criterion:
                         self.if_required = True
-                        self.if_information.extend(range(int(location.start.line), int(location.end.line)+1))
+                        self.if_information.update(range(int(location.start.line), int(location.end.line)+1))
                         if isinstance(original_node.test, cst.Comparison) and original_node.test.left.value not in self.slicing_criterion:
                             if hasattr(original_node.test.left, "attr"):
                                 self.slicing_criterion.add(original_node.test.left.value.value)
@@ -245,59 +292,52 @@ class GetIfInformation(cst.CSTTransformer):
                             if original_node.test.right.left.value not in self.slicing_criterion:
                                 self.slicing_criterion.add(original_node.test.right.left.value)
                     elif self.else_required and not self.if_required:
-                        self.if_information.append(int(location.start.line))
+                        self.if_information.add(int(location.start.line))
         
             # Remove any print statements ig?
             for i in range(len(original_node.body.body)):
                 body  = original_node.body.body[i].body[0]
                 if isinstance(body, cst.Expr) and isinstance(body.value, cst.Call) and body.value.func.value == 'print' and (int(location.start.line)+i+1) in self.if_information:
-                    self.if_information = [x for x in self.if_information if x!= (int(location.start.line)+i+1)]
+                    self.if_information.discard(int(location.start.line)+i+1)
         elif not result:
-            self.bad_ifs.extend(range(int(location.start.line), int(location.end.line)+1))
+            self.bad_ifs.update(range(int(location.start.line), int(location.end.line)+1))
             
         # Remove else lines if its not required
         if not self.else_required:
-            self.if_information = [x for x in self.if_information if x not in self.remove_information]
-        return updated_node    
+            self.if_information -= self.remove_information
     
-    def leave_Else_body(self, node: "Else") -> None:
-        location = self.get_metadata(PositionProvider, node)
+    def leave_Else_body(self, node: "Else", location: CodeRange) -> None:
         if isinstance(node.body.body[0], cst.SimpleStatementLine):
             body = node.body.body[0].body[0]
             if isinstance(body, cst.AugAssign):
                 value = body.target.value
                 # To handle condition where if would add the entire if-else block to if_info but else block is not needed
                 if value not in self.slicing_criterion:
-                    self.remove_information.extend(range(int(location.start.line), int(location.end.line)+1))
+                    self.remove_information.update(range(int(location.start.line), int(location.end.line)+1))
                 else:
-                    self.if_information.extend(range(int(location.start.line), int(location.end.line)+1))
+                    self.if_information.update(range(int(location.start.line), int(location.end.line)+1))
                     self.else_required = True
         
         if not self.else_required:
-            self.remove_information.extend(range(int(location.start.line), int(location.end.line)+1))
+            self.remove_information.update(range(int(location.start.line), int(location.end.line)+1))
                       
     def get_if_information(self):
         return self.if_information, self.slicing_criterion, self.bad_ifs
 
-class GetWhileInformation(cst.CSTTransformer):
+class GetWhileInformation:
     """
-    Returns the if information
+    Returns the while information from the while events of a ProgramStructure
     """
     
-    METADATA_DEPENDENCIES = (
-        PositionProvider,
-        ParentNodeProvider,
-    )
-    
     def __init__(self, slicing_criterion: set) -> None:
-        super().__init__()
-        self.while_information = []
+        self.while_information = set()
         self.slicing_criterion = slicing_criterion
     
-    def leave_While(
-        self, original_node: "While", updated_node: "While"
-    ) -> Union["BaseStatement", FlattenSentinel["BaseStatement"], cst.RemovalSentinel]:
-        location = self.get_metadata(PositionProvider, original_node)
+    def replay(self, while_events: List) -> None:
+        for node, location in while_events:
+            self.leave_While(node, location)
+
+    def leave_While(self, original_node: "While", location: CodeRange) -> None:
         for i in range(len(original_node.body.body)):
             if isinstance(original_node.body.body[i], cst.SimpleStatementLine):
                 body  = original_node.body.body[i].body[0]
@@ -313,82 +353,112 @@ class GetWhileInformation(cst.CSTTransformer):
                 if isinstance(body, cst.Assign) and isinstance(body.targets[0], cst.AssignTarget):
                     value = body.targets[0].target.value.value  #for cases like p.name = something, we set value to p
                 if value in self.slicing_criterion:
-                    self.while_information.extend(range(int(location.start.line), int(location.end.line)+1))
+                    self.while_information.update(range(int(location.start.line), int(location.end.line)+1))
                     if isinstance(original_node.test, cst.Comparison) and original_node.test.left.value not in self.slicing_criterion:
                         if hasattr(original_node.test.left, "attr"):
                             self.slicing_criterion.add(original_node.test.left.value.value)
                             self.slicing_criterion.add(original_node.test.left.attr.value) 
                         else: self.slicing_criterion.add(original_node.test.left.value)
-        
-        return updated_node
 
     def get_while_information(self):
         return self.while_information, self.slicing_criterion
     
     
-class IfConditionEvaluator:
+class NodeIndex(cst.CSTVisitor):
     """
-        Check if a condition will hold true
+        Maps every source range to the node get_node_by_location would return for it
     """
-    def __init__(self, slicing_dict: Dict):
-        self.slicing_dict = slicing_dict
-
-    def evaluate_if_condition(self, if_node) -> bool:
-        if hasattr(if_node, 'test'):
-            if isinstance(if_node.test, cst.Comparison):
-                return self._evaluate_comparison(if_node.test)
-            elif isinstance(if_node.test, cst.BooleanOperation):
-                return self._evaluate_boolean_operation(if_node.test)
-            # Handle other types of conditions if needed
-
-    def _evaluate_comparison(self, comparison_node) -> bool:
-        if (isinstance(comparison_node.comparisons[0].comparator, cst.Integer) or isinstance(comparison_node.comparisons[0].comparator, cst.SimpleString)) and isinstance(comparison_node.left, cst.Name):
-            comparator_value = self._get_value(comparison_node.comparisons[0].comparator)
-            left_value = type(comparator_value)(self._get_value(comparison_node.left))
-            operator = comparison_node.comparisons[0].operator.__class__.__name__
-            if operator == 'LessThan':
-                return left_value < comparator_value
-            elif operator == 'GreaterThan':
-                return left_value > comparator_value
-            elif operator == 'Equal':
-                return left_value == comparator_value
-
-    def _evaluate_boolean_operation(self, boolean_node) -> bool:
-        left_result = self._evaluate_comparison(boolean_node.left)
-        right_result = self._evaluate_comparison(boolean_node.right)
-        operator = boolean_node.operator.__class__.__name__
-
-        if operator == 'And':
-            return left_result and right_result
-        elif operator == 'Or':
-            return left_result or right_result
-
-    def _get_value(self, node) -> int:
-        if isinstance(node, cst.Name):
-            return type(node.value)(self.slicing_dict.get(node.value, 0))
-        elif isinstance(node, cst.Integer):
-            return int(node.value)
-        elif isinstance(node, cst.SimpleString):
-            return node.value
+    METADATA_DEPENDENCIES = (PositionProvider,)
 
+    def __init__(self) -> None:
+        super().__init__()
+        self.nodes = {}
+
+    def on_visit(self, node: cst.CSTNode) -> bool:
+        # later (deeper) nodes with the same range win, like in get_node_by_location
+        pos = self.get_metadata(PositionProvider, node)
+        self.nodes[(pos.start.line, pos.start.column, pos.end.line, pos.end.column)] = node
+        return True
+
+
+def source_hash(code: str) -> str:
+    return hashlib.sha256(code.encode()).hexdigest()
+
+def metadata_wrapper(code: str) -> cst.metadata.MetadataWrapper:
+    """
+        Returns the shared metadata wrapper of code, parsing it only the first time a source hash is seen
+    """
+    key = source_hash(code)
+    wrapper = _module_cache.get(key)
+    if wrapper is None:
+        wrapper = _module_cache[key] = cst.metadata.MetadataWrapper(cst.parse_module(code))
+        if len(_module_cache) > MAX_CACHED_MODULES:
+            _module_cache.popitem(last=False)
+    else:
+        _module_cache.move_to_end(key)
+    return wrapper
+
+def program_structure(code: str) -> ProgramStructure:
+    """
+        Returns the class/if/while facts of code, collected by one traversal per source hash
+    """
+    key = source_hash(code)
+    structure = _structure_cache.get(key)
+    if structure is None:
+        structure = _structure_cache[key] = ProgramStructure()
+        metadata_wrapper(code).visit(structure)
+        if len(_structure_cache) > MAX_CACHED_MODULES:
+            _structure_cache.popitem(last=False)
+    else:
+        _structure_cache.move_to_end(key)
+    return structure
+
+def target_name(node: cst.CSTNode) -> Optional[str]:
+    """
+        Returns the variable (or base object) a read, write or call node refers to, if it has a plain name
+    """
+    if isinstance(node, cst.Name):
+        return node.value
+    if isinstance(node, cst.Assign):
+        target = node.targets[0].target
+    elif isinstance(node, (cst.AugAssign, cst.AnnAssign)):
+        target = node.target
+    elif isinstance(node, cst.Call):
+        target = node.func
+    elif isinstance(node, cst.FunctionDef):
+        return node.name.value
+    else:
+        return None
+    while isinstance(target, (cst.Attribute, cst.Subscript)):
+        target = target.value
+    return target.value if isinstance(target, cst.Name) else None
+
+def iid_index(code: str, iid_to_location: Dict[int, Location]) -> List[Optional[IidEntry]]:
+    """
+        Resolves every iid of an instrumented file to its node, line and node kind in a single tree walk
+    """
+    node_index = NodeIndex()
+    metadata_wrapper(code).visit(node_index)
+    index = [None] * (max(iid_to_location, default=-1) + 1)
+    for iid, location in iid_to_location.items():
+        node = node_index.nodes.get(location[1:])
+        index[iid] = IidEntry(location, node, location.start_line, type(node).__name__, target_name(node))
+    return index
 
 def negate_odd_ifs(code: str) -> str:
-    syntax_tree = cst.parse_module(code)
-    wrapper = cst.metadata.MetadataWrapper(syntax_tree)
     code_modifier = OddIfNegation()
-    new_syntax_tree = wrapper.visit(code_modifier)
+    new_syntax_tree = metadata_wrapper(code).visit(code_modifier)
     return new_syntax_tree.code
 
-def remove_lines(code: str, lines_to_keep: []) -> str:
-    syntax_tree = cst.parse_module(code)
-    wrapper = cst.metadata.MetadataWrapper(syntax_tree)
+def remove_lines(code: str, lines_to_keep: set) -> str:
+    if not isinstance(lines_to_keep, (set, frozenset)):
+        lines_to_keep = set(lines_to_keep)
     code_modifier = RemoveLines(lines_to_keep)
-    new_syntax_tree = wrapper.visit(code_modifier)
+    new_syntax_tree = metadata_wrapper(code).visit(code_modifier)
     return new_syntax_tree.code
 
 def slicing_criterion(code: str) -> tuple[set, int]:
-    syntax_tree = cst.parse_module(code)
-    wrapper = cst.metadata.MetadataWrapper(syntax_tree)
+    wrapper = metadata_wrapper(code)
     
     slicing_criterion_location = SlicingCriterionLocation()
     scl_ayntax_tree = wrapper.visit(slicing_criterion_location)
@@ -397,27 +467,33 @@ def slicing_criterion(code: str) -> tuple[set, int]:
     sc_synyax_tree = wrapper.visit(slicing_criterion)
     return slicing_criterion.get_slicing_criterion(), slicing_criterion_location.get_slicing_criterion_location()
 
-def class_information(code: str):
-    syntax_tree = cst.parse_module(code)
-    wrapper = cst.metadata.MetadataWrapper(syntax_tree)
-    get_class_info = GetClassInformation()
-    syntax_tree = wrapper.visit(get_class_info)
-    return get_class_info.class_info()
-
-def if_information(code: str, criterion: set, write_values: Dict):
-    syntax_tree = cst.parse_module(code)
-    wrapper = cst.metadata.MetadataWrapper(syntax_tree)
-    get_if_info = GetIfInformation(criterion, write_values)
-    new_syntax_tree = wrapper.visit(get_if_info)
-    # print("new_syntax_tree.code:", new_syntax_tree.code)
+def slicing_criteria(code: str) -> List[tuple[set, int]]:
+    """
+        Returns the criterion of every "# slicing criterion" comment, in source order
+    """
+    slicing_criterion_location = SlicingCriterionLocation()
+    metadata_wrapper(code).visit(slicing_criterion_location)
+    return [(slicing_criterion_at(code, line), line) for line in slicing_criterion_location.slicing_criterion_locations]
+
+def slicing_criterion_at(code: str, line: int) -> set:
+    """
+        Returns the variables used on a given line, as if it carried the "# slicing criterion" comment
+    """
+    criterion = SlicingCriterion(line)
+    metadata_wrapper(code).visit(criterion)
+    return criterion.get_slicing_criterion()
+
+def class_information(code: str) -> set:
+    return set(program_structure(code).class_info())
+
+def if_information(code: str, criterion: set, branch_outcomes: Optional[Dict] = None):
+    get_if_info = GetIfInformation(criterion, branch_outcomes)
+    get_if_info.replay(program_structure(code).if_events)
     return get_if_info.get_if_information() 
 
 def while_information(code: str, criterion: set):
-    syntax_tree = cst.parse_module(code)
-    wrapper = cst.metadata.MetadataWrapper(syntax_tree)
     get_while_info = GetWhileInformation(criterion)
-    new_syntax_tree = wrapper.visit(get_while_info)
-    # print("new_syntax_tree.code:", new_syntax_tree.code)
+    get_while_info.replay(program_structure(code).while_events)
     return get_while_info.get_while_information()
 
 # original_code = """def slice_me():
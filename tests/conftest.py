@@ -1,5 +1,8 @@
 from os import walk
 from os.path import realpath, dirname, sep
+import pytest
+
+from dynamicslicing.instrument_cache import CACHE_DIR_VARIABLE
 
 
 def pytest_addoption(parser):
@@ -11,7 +14,17 @@ def pytest_addoption(parser):
     )
 
 
+@pytest.fixture(scope="session", autouse=True)
+def instrument_cache_dir(tmp_path_factory):
+    # instrumented corpus programs are cached for this session only, never in the user's cache
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv(CACHE_DIR_VARIABLE, str(tmp_path_factory.mktemp("instrument-cache")))
+        yield
+
+
 def pytest_generate_tests(metafunc):
+    if "directory_pair" not in metafunc.fixturenames:
+        return
     # find all subdirectories that contain a micro-test
     directories = []
     selection = metafunc.config.getoption("only", default=None, skip=False)
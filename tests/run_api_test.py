@@ -0,0 +1,95 @@
+from os import listdir
+from os.path import join
+from typing import Tuple
+import pytest
+
+from dynamicslicing.api import prepare, run, slice_source
+from dynamicslicing.utils import slicing_criterion
+from run_single_test import correct_output
+
+
+def test_slice_source(directory_pair: Tuple[str, str]):
+    abs_dir, rel_dir = directory_pair
+    analysis = "dataflow" if rel_dir.startswith("milestone2") else "full"
+    with open(join(abs_dir, "program.py"), "r") as file:
+        source = file.read()
+    with open(join(abs_dir, "expected.py"), "r") as file:
+        expected = file.read()
+    files = sorted(listdir(abs_dir))
+
+    # slicing the same source twice reuses its instrumentation
+    for _ in range(2):
+        result = slice_source(source, analysis=analysis)
+        if not correct_output(expected, result.sliced):
+            pytest.fail(f"In-memory slice of {rel_dir} does not match expected output.\n--> Expected:\n{expected}\n--> Actual:\n{result.sliced}")
+    assert slicing_criterion(source)[1] in result.lines
+    assert sorted(listdir(abs_dir)) == files
+
+
+def test_slice_source_criterion():
+    source = "\n".join([
+        "a = 1",
+        "b = 2",
+        "c = a + b",
+        "print(c)",
+        "d = 4",
+    ]) + "\n"
+    result = slice_source(source, criterion=(4, None))
+    assert result.lines == {1, 2, 3, 4}
+    assert result.criteria >= {"a", "b", "c"}
+    assert result.output == "3\n"
+    assert slice_source(source, criterion=(3, {"a"})).lines == {1, 3}
+
+
+def test_saturated_events():
+    source = "\n".join([
+        "total = 0",
+        "for i in range(1000):",
+        "    total += i",
+        "print(total)",
+    ]) + "\n"
+    for analysis in ("full", "dataflow"):
+        slicer, code = prepare(source, (4, None), analysis)
+        result = run(slicer, code)
+        assert result.lines == {1, 3, 4}
+        # every iteration after the first two adds nothing
+        assert slicer.saturated_events >= 990 and len(slicer.trace) < 10
+        # the reads of i are off the criterion line, so the read hook drops them
+        assert slicer.filtered_reads >= 1000
+
+
+def test_control_and_loop_carried_dependences():
+    source = "\n".join([
+        "i = 0",
+        "n = 3",
+        "s = 0",
+        "while i < n:",
+        "    s += 2",
+        "    i += 1",
+        "print(s)",
+    ]) + "\n"
+    # the loop runs as long as i < n, so n decides what s becomes
+    assert slice_source(source, criterion=(7, None)).lines == {1, 2, 3, 4, 5, 6, 7}
+    source = "\n".join([
+        "x = 1",
+        "y = 0",
+        "for i in range(2):",
+        "    y = x",
+        "    x = 5 + i",
+        "print(y)",
+    ]) + "\n"
+    # the second y = x copies the x of the line below it, and overwrites the y and x before the loop
+    for analysis in ("full", "dataflow"):
+        assert slice_source(source, criterion=(6, None), analysis=analysis).lines == {4, 5, 6}
+
+
+@pytest.mark.parametrize("analysis", ["full", "dataflow", "shadow", "forward"])
+def test_overwritten_definition(analysis):
+    # only the definition print(x) reads is part of its slice
+    assert slice_source("x = 1\nx = 2\nprint(x)\n", criterion=(3, None), analysis=analysis).lines == {2, 3}
+
+
+@pytest.mark.parametrize("analysis", ["full", "dataflow", "shadow", "forward"])
+def test_missing_criterion(analysis):
+    with pytest.raises(ValueError, match="no slicing criterion"):
+        slice_source("x = 1\nprint(x)\n", analysis=analysis)
@@ -0,0 +1,63 @@
+from dynamicslicing.api import prepare, run
+from dynamicslicing.offline import OfflineSlicer
+from run_offline_test import record
+
+
+def test_branch_outcomes():
+    source = "\n".join([
+        "x = 5",
+        "x = x - 4",
+        "y = 0",
+        "if x < 3:",
+        "    y = 1",
+        "if x > 3:",
+        "    y = 2",
+        "print(y)",
+    ]) + "\n"
+    slicer, code = prepare(source, (8, None))
+    result = run(slicer, code)
+    assert slicer.branch_outcomes() == {(4, 0, 5, 9): (1, 0), (6, 0, 7, 9): (0, 1)}
+    # evaluating x < 3 against the literal 5 would drop the branch that ran, whose y = 1 hides y = 0
+    assert result.lines == {1, 2, 4, 5, 8}
+
+
+def test_large_list_slice():
+    size = 256
+    source = "\n".join([
+        f"values = [{', '.join(str(i) for i in range(size))}]",
+        "first = values[0]",
+        f"last = values[{size - 1}]",
+        "x = 0",
+        "if first == 0:",
+        "    x += 1",
+        "print(x)",
+    ]) + "\n"
+    slicer, code = prepare(source, (7, None))
+    assert run(slicer, code).lines == {1, 2, 4, 5, 6, 7}
+
+
+def test_recorded_outcomes(tmp_path):
+    source = "\n".join([
+        "def check(x):",
+        "    if x > 5:",
+        "        return 1",
+        "    return 0",
+        f"ages = [{', '.join(str(i) for i in range(100))}]",
+        "x = ages[80]",
+        "y = 0",
+        "if x > 5:",
+        "    y = check(x)",
+        "if x > 1000:",
+        "    y = 2",
+        "print(y)",
+    ]) + "\n"
+    program_file = str(tmp_path / "program.py")
+    with open(program_file, "w") as file:
+        file.write(source)
+    slicer = OfflineSlicer(record(program_file))
+    analysis = slicer.analysis(12)
+    # the trace holds the outcomes, so no condition is evaluated again
+    assert analysis.branch_outcomes() == {(2, 4, 3, 16): (1, 0), (8, 0, 9, 16): (1, 0), (10, 0, 11, 9): (0, 1)}
+    assert "y = 2" not in analysis.slice_code()
+    live, code = prepare(source, (12, None))
+    assert run(live, code).lines == set(analysis.line_numbers)
@@ -0,0 +1,69 @@
+import json
+from os.path import join
+from pathlib import Path
+from shutil import copyfile
+
+from dynapyt.instrument.IIDs import IIDs
+from dynapyt.instrument.instrument import instrument_file as dynapyt_instrument_file
+from dynapyt.utils.hooks import get_hooks_from_analysis
+from dynamicslicing import instrument_cache
+from dynamicslicing.instrument_cache import CACHE_DIR_VARIABLE, instrument_file, iid_locations
+
+
+def test_instrument_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv(CACHE_DIR_VARIABLE, str(tmp_path / "cache"))
+    source = join("tests", "milestone3", "test_3", "program.py")
+    selected_hooks = get_hooks_from_analysis([f"dynamicslicing.slice.Slice:{source}"])
+
+    # the first copy fills the cache, the second one is served from it
+    instrumented = {}
+    for name in ["reference", "first", "second"]:
+        (tmp_path / name).mkdir()
+        program_file = str(tmp_path / name / "program.py")
+        copyfile(source, program_file)
+        if name == "reference":
+            dynapyt_instrument_file(program_file, selected_hooks)
+        else:
+            instrument_file(program_file, selected_hooks)
+        with open(program_file, "r") as file:
+            code = file.read()
+        with open(join(tmp_path, name, "program-dynapyt.json"), "r") as file:
+            iids = json.load(file)
+        instrumented[name] = (code.replace(str(tmp_path / name), ""), json.dumps(iids).replace(str(tmp_path / name), ""))
+        assert Path(program_file + ".orig").read_text() == Path(source).read_text()
+
+    assert len(list((tmp_path / "cache").iterdir())) == 1
+    assert instrumented["first"] == instrumented["second"] == instrumented["reference"]
+    orig_file = str(tmp_path / "second" / "program.py.orig")
+    assert iid_locations(orig_file) == IIDs(orig_file).iid_to_location
+
+
+def test_unmatched_path_is_not_cached(tmp_path, monkeypatch):
+    monkeypatch.setenv(CACHE_DIR_VARIABLE, str(tmp_path / "cache"))
+    # a path spelled differently from dynapyt's literal cannot be replaced by the placeholder
+    monkeypatch.setattr(instrument_cache, "path_literal", lambda path: '"elsewhere"')
+    source = join("tests", "milestone3", "test_3", "program.py")
+    selected_hooks = get_hooks_from_analysis([f"dynamicslicing.slice.Slice:{source}"])
+    program_file = str(tmp_path / "program.py")
+    copyfile(source, program_file)
+    instrument_file(program_file, selected_hooks)
+
+    assert not (tmp_path / "cache").exists() or not any((tmp_path / "cache").iterdir())
+    assert str(tmp_path / "program.py") in Path(program_file).read_text()
+
+
+def test_selected_lines(tmp_path, monkeypatch):
+    monkeypatch.setenv(CACHE_DIR_VARIABLE, str(tmp_path / "cache"))
+    source = join("tests", "milestone3", "test_3", "program.py")
+    selected_hooks = get_hooks_from_analysis([f"dynamicslicing.slice.Slice:{source}"])
+    # every selection is cached apart, and leaves the other lines without data hooks
+    code = {}
+    for name, selected_lines in [("all", None), ("pre-slice", {2, 3}), ("other", {4})]:
+        (tmp_path / name).mkdir()
+        program_file = str(tmp_path / name / "program.py")
+        copyfile(source, program_file)
+        instrument_file(program_file, selected_hooks, selected_lines)
+        code[name] = Path(program_file).read_text()
+    assert len(list((tmp_path / "cache").iterdir())) == 3
+    assert code["all"].count("_rt._write_(") == 5
+    assert code["pre-slice"].count("_rt._write_(") == 2 and code["other"].count("_rt._write_(") == 1
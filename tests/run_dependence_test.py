@@ -0,0 +1,70 @@
+import libcst as cst
+import pytest
+
+import dynamicslicing.dependence as dependence
+from dynamicslicing.dependence import DependenceBuilder, DependenceGraph
+from dynamicslicing.trace import WRITE, BRANCH_TAKEN, BRANCH_NOT_TAKEN
+
+
+def graph() -> DependenceGraph:
+    # 0 <- 1 <- 3 and 2 <- 3, while 4 and 5 depend on each other only
+    lines = {0: 1, 1: 2, 2: 3, 3: 4, 4: 5, 5: 5}
+    return DependenceGraph.from_edges(lines, {0: (), 1: (0,), 2: (), 3: (1, 2), 4: (5,), 5: (4,)})
+
+
+@pytest.mark.parametrize("vectorized", [True, False])
+def test_csr_closure(vectorized, monkeypatch):
+    if vectorized:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(dependence, "numpy", None)
+    csr = graph().to_csr()
+    assert list(csr.indptr) == [0, 0, 1, 1, 3, 4, 5]
+    assert graph().reachable([3]) == {0, 1, 2, 3}
+    assert graph().reachable([4]) == {4, 5}
+    assert graph().reachable_lines([1, 2]) == {1, 2, 3}
+    assert graph().reachable([]) == set()
+
+
+def wide_graph() -> DependenceGraph:
+    # a hub depending on 600 children, each depending on one of 50 shared grandchildren, plus an unreachable tail
+    width = 600
+    edges = {0: tuple(range(1, width + 1))}
+    edges.update((child, (width + 1 + child % 50,)) for child in range(1, width + 1))
+    edges.update((grandchild, ()) for grandchild in range(width + 1, width + 51))
+    edges.update({width + 51: (0,), width + 52: ()})
+    return DependenceGraph.from_edges({event: event % 97 + 1 for event in edges}, edges)
+
+
+def test_wide_frontier(monkeypatch):
+    pytest.importorskip("numpy")
+    assert len(wide_graph().successors(0)) > dependence.VECTOR_FRONTIER
+    vectorized = wide_graph()
+    results = (vectorized.reachable([0]), vectorized.reachable_lines([0]), vectorized.reachable([0, 5, 651]))
+    monkeypatch.setattr(dependence, "numpy", None)
+    plain = wide_graph()
+    assert results == (plain.reachable([0]), plain.reachable_lines([0]), plain.reachable([0, 5, 651]))
+    assert results[0] == set(range(651))
+    assert results[2] == set(range(652))
+
+
+def test_builder_executions():
+    # x = 1 / while x < 3: / x = x + 1, the body running twice
+    init = cst.parse_statement("x = 1").body[0]
+    loop = cst.parse_statement("while x < 3:\n    x = x + 1\n")
+    step = loop.body.body[0].body[0]
+    builder = DependenceBuilder(lambda file, line: 2 if line == 3 else None)
+    # events are numbered apart from the nodes, as reads in between are not nodes
+    for position, (kind, line, node) in enumerate([
+        (WRITE, 1, init), (BRANCH_TAKEN, 2, loop), (WRITE, 3, step),
+        (BRANCH_TAKEN, 2, loop), (WRITE, 3, step), (BRANCH_NOT_TAKEN, 2, loop),
+    ]):
+        assert builder.add(2 * position, kind, "program.py", line, node) == position
+    graph = builder.graph()
+    # every execution depends on the previous one of x and on the header evaluation it runs under
+    assert {event: set(graph.successors(event)) for event in graph.to_csr().events} == {
+        0: set(), 2: {0}, 4: {0, 2}, 6: {4}, 8: {4, 6}, 10: {8},
+    }
+    assert graph.reachable([4]) == {0, 2, 4}
+    assert graph.backward_slice({"x"}, 1) == {0}
+    assert graph.reachable_lines([10]) == {1, 2, 3}
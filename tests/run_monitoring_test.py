@@ -0,0 +1,79 @@
+import sys
+from os.path import exists, join
+from typing import Tuple
+import pytest
+
+from dynamicslicing.api import slice_source
+from run_single_test import correct_output
+
+needs_monitoring = pytest.mark.skipif(sys.version_info < (3, 12), reason="sys.monitoring needs Python 3.12")
+
+
+@needs_monitoring
+def test_monitoring_backend(directory_pair: Tuple[str, str]):
+    abs_dir, rel_dir = directory_pair
+    analysis = "dataflow" if rel_dir.startswith("milestone2") else "full"
+    program_file = join(abs_dir, "program.py")
+    if exists(program_file + ".orig"):
+        program_file += ".orig"
+    with open(program_file, "r") as file:
+        source = file.read()
+    with open(join(abs_dir, "expected.py"), "r") as file:
+        expected = file.read()
+    result = slice_source(source, analysis=analysis, backend="monitoring")
+    if not correct_output(expected, result.sliced):
+        pytest.fail(f"Monitored slice of {rel_dir} does not match expected output.\n--> Expected:\n{expected}\n--> Actual:\n{result.sliced}")
+    assert result.lines == slice_source(source, analysis=analysis).lines
+
+
+@needs_monitoring
+def test_monitoring_functions():
+    source = "\n".join([
+        "def double(x):",
+        "    y = x * 2",
+        "    return y",
+        "def gen(n):",
+        "    for i in range(n):",
+        "        yield i",
+        "a = double(3)",
+        "b = sum(gen(a))",
+        "print(b)",
+    ]) + "\n"
+    result = slice_source(source, criterion=(9, None), backend="monitoring")
+    assert result.output == "15\n"
+    assert result.lines == slice_source(source, criterion=(9, None)).lines
+
+
+@pytest.mark.skipif(sys.version_info >= (3, 12), reason="sys.monitoring is available")
+def test_monitoring_unavailable():
+    with pytest.raises(RuntimeError, match=r"3\.12"):
+        slice_source("a = 1\n", criterion=(1, None), backend="monitoring")
+
+
+@needs_monitoring
+def test_monitoring_branches():
+    source = "\n".join([
+        "def clamp(x):",
+        "    if x > 5:",
+        "        x = 5",
+        "    return x",
+        "def sign(x):",
+        "    y = 1",
+        "    if x < 0:",
+        "        y = -1",
+        "    return y",
+        "total = 0",
+        "for i in range(8):",
+        "    if i % 2 == 0:",
+        "        continue",
+        "    total += clamp(i)",
+        "flag = sign(total)",
+        "if total > 100:",
+        "    flag = 0",
+        "print(total, flag)",
+    ]) + "\n"
+    result = slice_source(source, criterion=(18, None), backend="monitoring")
+    live = slice_source(source, criterion=(18, None))
+    assert result.output == live.output == "14 1\n"
+    assert result.lines == live.lines
+    assert 17 not in result.lines
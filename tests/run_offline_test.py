@@ -0,0 +1,139 @@
+import sys
+import runpy
+from os.path import join
+from shutil import copyfile
+from typing import Any, Optional, Set, Tuple
+import pytest
+
+from dynapyt.utils.hooks import get_hooks_from_analysis
+from dynamicslicing.instrument_cache import instrument_file
+from dynamicslicing.offline import ANALYSES, RecordTrace, OfflineSlicer, trace_file_name
+from dynamicslicing.trace import TraceRecorder, EVENT_SIZE, MEMORY_LIMIT_VARIABLE
+from dynamicslicing.utils import slicing_criterion
+from run_single_test import correct_output
+
+
+def record(program_file: str, analysis: Optional[Any] = None, selected_lines: Optional[Set[int]] = None) -> str:
+    # runs program_file under analysis, a RecordTrace by default, with only the hooks it defines
+    import dynapyt.runtime as _rt
+
+    analysis = analysis or RecordTrace(program_file)
+    analysis_class = type(analysis)
+    selected_hooks = get_hooks_from_analysis([f"{analysis_class.__module__}.{analysis_class.__name__}:{program_file}"])
+    instrument_file(program_file, selected_hooks, selected_lines)
+    _rt.analyses = None
+    _rt.set_analysis([analysis])
+    runpy.run_path(program_file)
+    _rt.end_execution()
+    del sys.modules["dynapyt.runtime"]
+    return trace_file_name(program_file)
+
+
+def test_offline_slice(directory_pair: Tuple[str, str], tmp_path):
+    abs_dir, rel_dir = directory_pair
+    analysis = "dataflow" if rel_dir.startswith("milestone2") else "full"
+
+    # record into a private copy so the test directory stays untouched
+    program_file = str(tmp_path / "program.py")
+    copyfile(join(abs_dir, "program.py"), program_file)
+    with open(program_file, "r") as file:
+        line = slicing_criterion(file.read())[1]
+    slicer = OfflineSlicer(record(program_file))
+
+    with open(join(abs_dir, "expected.py"), "r") as file:
+        expected = file.read()
+    # slicing the same trace repeatedly must give the same answer
+    for _ in range(2):
+        actual = slicer.slice(line, analysis=analysis)
+        if not correct_output(expected, actual):
+            pytest.fail(
+                f"Offline slice of {rel_dir} does not match expected output.\n--> Expected:\n{expected}\n--> Actual:\n{actual}"
+            )
+
+
+def replayed(slicer: OfflineSlicer, line: int, analysis: str):
+    # every handler on every event, as a replay did before the trace was indexed
+    expected = ANALYSES[analysis](slicer.source_file, criterion=(line, None), code=slicer.source())
+    expected.iid_indices = slicer.iid_indices
+    handlers = expected.handlers()
+    for event, (kind, iid, _line, _frame, _name, file) in enumerate(slicer.trace):
+        if handlers[kind] is not None:
+            handlers[kind](slicer.iid_entry(slicer.trace.file_table[file], iid), event)
+    return expected
+
+
+def assert_indexed_replay(program_file: str) -> None:
+    slicer = OfflineSlicer(record(program_file))
+    for analysis in ("full", "dataflow"):
+        for line in range(1, len(slicer.source().splitlines()) + 1):
+            expected, actual = replayed(slicer, line, analysis), slicer.analysis(line, None, analysis)
+            assert actual.line_numbers == expected.line_numbers, (program_file, analysis, line)
+            assert actual.slice_criteria == expected.slice_criteria, (program_file, analysis, line)
+
+
+def test_indexed_replay(directory_pair: Tuple[str, str], tmp_path):
+    abs_dir, _rel_dir = directory_pair
+    program_file = str(tmp_path / "program.py")
+    copyfile(join(abs_dir, "program.py"), program_file)
+    assert_indexed_replay(program_file)
+
+
+def test_indexed_replay_new_names(tmp_path):
+    program_file = tmp_path / "program.py"
+    # label brings in xs halfway, so only the hooks of xs after it are handled
+    program_file.write_text("\n".join([
+        "xs = [1]",
+        "for i in range(2):",
+        "    label = f\"{xs[0]}\"",
+        "    xs = [i]",
+        "print(label)",
+    ]) + "\n")
+    assert_indexed_replay(str(program_file))
+    slicer = OfflineSlicer(trace_file_name(str(program_file)))
+    analysis = slicer.analysis(5)
+    assert analysis.slice_criteria == replayed(slicer, 5, "full").slice_criteria == {"print", "label", "xs"}
+    analysis.slice_code()
+    # the last label reads the xs of the first iteration
+    assert analysis.line_numbers == {3, 4, 5}
+
+
+def test_batch_slice(tmp_path):
+    from dynamicslicing.offline import BatchSlice
+
+    test_dir = join("tests", "milestone3", "test_3")
+    program_file = str(tmp_path / "program.py")
+    copyfile(join(test_dir, "program.py"), program_file)
+    with open(program_file, "r") as file:
+        line = slicing_criterion(file.read())[1]
+
+    batch = BatchSlice(program_file, [(line, None), (line - 3, {"middle_age"}), (line, None)])
+    record(program_file, batch)
+
+    # duplicate criteria are sliced once, and every slice is written to its own file
+    assert sorted(batch.results) == [(line - 3, frozenset({"middle_age"})), (line, None)]
+    with open(join(test_dir, "expected.py"), "r") as file:
+        assert correct_output(file.read(), batch.results[(line, None)])
+    with open(tmp_path / f"sliced_{line - 3}_middle_age.py", "r") as file:
+        assert file.read() == batch.results[(line - 3, frozenset({"middle_age"}))]
+
+
+def test_spilled_trace(tmp_path, monkeypatch):
+    test_dir = join("tests", "milestone3", "test_3")
+    program_file = str(tmp_path / "program.py")
+    copyfile(join(test_dir, "program.py"), program_file)
+    with open(program_file, "r") as file:
+        line = slicing_criterion(file.read())[1]
+
+    # keep eight events in memory, everything else goes to disk
+    monkeypatch.setenv(MEMORY_LIMIT_VARIABLE, str(8 * EVENT_SIZE))
+    recorder = RecordTrace(program_file)
+    trace_file = record(program_file, recorder)
+    assert recorder.trace.capacity == 8 and len(recorder.trace.segments) > 1
+
+    saved, metadata = TraceRecorder.load(trace_file)
+    assert list(saved) == list(recorder.trace)
+    assert [saved.event(i) for i in range(len(saved))] == list(recorder.trace)
+    with open(join(test_dir, "expected.py"), "r") as file:
+        expected = file.read()
+    assert correct_output(expected, OfflineSlicer.from_trace(recorder.trace, metadata).slice(line))
+    assert correct_output(expected, OfflineSlicer(trace_file).slice(line))
@@ -0,0 +1,38 @@
+from os import walk
+from os.path import dirname, join, realpath, relpath
+
+from dynamicslicing.harness import SliceJob, run_jobs
+from run_single_test import correct_output
+
+
+def test_parallel_corpus():
+    tests_dir = dirname(realpath(__file__))
+    jobs, expected = [], []
+    for root, _dirs, files in walk(tests_dir):
+        if "program.py" in files and "expected.py" in files:
+            analysis = "dataflow" if relpath(root, tests_dir).startswith("milestone2") else "full"
+            jobs.append(SliceJob(join(root, "program.py"), analysis))
+            with open(join(root, "expected.py"), "r") as file:
+                expected.append(file.read())
+    snapshot = {root: sorted(files) for root, _dirs, files in walk(tests_dir) if "__pycache__" not in root}
+
+    results = run_jobs(jobs, processes=4)
+
+    assert [result.program for result in results] == [job.program for job in jobs]
+    for result, expected_code in zip(results, expected):
+        assert result.error is None, result.error
+        assert correct_output(expected_code, result.sliced), result.program
+    # the corpus itself is never touched
+    assert snapshot == {root: sorted(files) for root, _dirs, files in walk(tests_dir) if "__pycache__" not in root}
+
+
+def test_sibling_imports(tmp_path):
+    (tmp_path / "helper.py").write_text("def double(x):\n    return 2 * x\n")
+    program_file = tmp_path / "program.py"
+    program_file.write_text("from helper import double\na = 1\nb = 2\nc = double(a)\nprint(c) # slicing criterion\n")
+
+    [result] = run_jobs([SliceJob(str(program_file))], processes=1)
+
+    assert result.error is None, result.error
+    assert "b = 2" not in result.sliced and "c = double(a)" in result.sliced
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["helper.py", "program.py"]
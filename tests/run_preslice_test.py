@@ -0,0 +1,79 @@
+from os.path import join
+from shutil import copyfile
+from typing import Tuple
+import pytest
+
+from dynamicslicing.api import slice_source
+from dynamicslicing.preslice import relevant_lines, static_slice
+from run_offline_test import record
+from run_single_test import correct_output
+
+
+def test_preslice_runner(directory_pair: Tuple[str, str], tmp_path):
+    abs_dir, rel_dir = directory_pair
+    if rel_dir.startswith("milestone2"):
+        from dynamicslicing.slice_dataflow import SliceDataflow as analysis_class
+    else:
+        from dynamicslicing.slice import Slice as analysis_class
+
+    program_file = str(tmp_path / "program.py")
+    copyfile(join(abs_dir, "program.py"), program_file)
+    with open(program_file, "r") as file:
+        source = file.read()
+    # the .orig copy only exists once record has instrumented the program
+    record(program_file, analysis_class(program_file + ".orig", code=source), relevant_lines(source))
+
+    with open(join(abs_dir, "expected.py"), "r") as file:
+        expected = file.read()
+    with open(tmp_path / "sliced.py", "r") as file:
+        actual = file.read()
+    if not correct_output(expected, actual):
+        pytest.fail(
+            f"Pre-sliced output of {rel_dir} does not match expected output.\n--> Expected:\n{expected}\n--> Actual:\n{actual}"
+        )
+
+
+def test_static_slice():
+    code = "\n".join([
+        "total = 0",
+        "log = []",
+        "for i in range(10):",
+        "    log.append(i)",
+        "    total += i",
+        "label = 'small'",
+        "if total > 5:",
+        "    label = 'big'",
+        "result = total * 2",
+        "print(result)",
+    ])
+    # log.append(i) may change i as far as names tell
+    assert static_slice(code, 10, {"result"}) == {1, 2, 3, 4, 5, 9, 10}
+    assert static_slice(code, 8, {"label"}) == {1, 2, 3, 4, 5, 6, 7, 8}
+
+
+def test_static_slice_call_arguments():
+    code = "\n".join([
+        "def fill(items):",
+        "    items.append(1)",
+        "xs = []",
+        "ys = [2]",
+        "zs = []",
+        "fill(xs)",
+        "zs.extend(ys)",
+        "a = xs",
+        "b = zs",
+    ])
+    # objects passed to a call may be changed by it
+    assert static_slice(code, 8, {"xs"}) == {1, 2, 3, 6, 8}
+    assert static_slice(code, 9, {"zs"}) == {4, 5, 7, 9}
+
+
+def test_preslice_source():
+    source = "\n".join([
+        "a = 1",
+        "b = 2",
+        "c = a + 1",
+        "print(c) # slicing criterion",
+    ]) + "\n"
+    for analysis in ("full", "dataflow", "shadow", "forward"):
+        assert slice_source(source, analysis=analysis, preslice=True).lines == slice_source(source, analysis=analysis).lines
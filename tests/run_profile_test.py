@@ -0,0 +1,66 @@
+import json
+from os.path import join
+from shutil import copyfile
+
+from dynamicslicing.api import slice_source
+from dynamicslicing.profiling import PROFILE_VARIABLE, RESERVOIR_SIZE, Latencies
+from dynamicslicing.slice import Slice
+from run_offline_test import record
+
+
+def test_profile_report(tmp_path, monkeypatch):
+    program_file = str(tmp_path / "program.py")
+    copyfile(join("tests", "milestone3", "test_3", "program.py"), program_file)
+    report_file = tmp_path / "profile.json"
+    monkeypatch.setenv(PROFILE_VARIABLE, str(report_file))
+
+    with open(program_file, "r") as file:
+        source = file.read()
+    # the .orig copy only exists once record has instrumented the program
+    record(program_file, Slice(program_file + ".orig", code=source))
+
+    with open(report_file, "r") as file:
+        report = json.load(file)
+    assert report["analysis"] == "Slice"
+    assert report["hooks"]["write"]["calls"] == 5
+    assert report["hooks"]["end_execution"]["calls"] == 1
+    assert report["hooks"]["read"]["p50_ns"] <= report["hooks"]["read"]["p99_ns"] <= report["hooks"]["read"]["max_ns"]
+    assert set(report["phases"]) == {"process events", "if information", "while information", "dependence graph", "backward pass", "remove lines"}
+    # the hooks only buffer events, the handlers do the work when the buffer is drained
+    assert set(report["handlers"]) == {"on_read", "on_write", "on_pre_call", "on_post_call", "on_function_enter"}
+    assert report["handlers"]["on_write"]["calls"] == 5
+    # every hook call and handler run is attributed to a source line
+    assert sum(line["events"] for line in report["lines"]) == sum(
+        hook["calls"] for name, hook in report["hooks"].items() if name != "end_execution"
+    )
+    assert sum(line["handler_ns"] for line in report["lines"]) == sum(
+        handler["total_ns"] for handler in report["handlers"].values()
+    )
+    assert all(line["total_ns"] == line["hook_ns"] + line["handler_ns"] for line in report["lines"])
+    assert {line["line"] for line in report["lines"]} >= {2, 3, 4, 5, 6, 8, 9}
+
+
+def test_profile_slice_source(tmp_path, monkeypatch):
+    # slice_source never goes through dynapyt's end_execution, the report is written by slice_code
+    report_file = tmp_path / "profile.json"
+    monkeypatch.setenv(PROFILE_VARIABLE, str(report_file))
+    with open(join("tests", "milestone3", "test_3", "program.py"), "r") as file:
+        slice_source(file.read())
+
+    with open(report_file, "r") as file:
+        report = json.load(file)
+    assert report["hooks"]["write"]["calls"] == 5
+    assert "end_execution" not in report["hooks"]
+    assert {"dependence graph", "backward pass", "remove lines"} <= set(report["phases"])
+
+
+def test_latencies_bounded():
+    latencies = Latencies()
+    for elapsed in range(10 * RESERVOIR_SIZE):
+        latencies.add(elapsed)
+    assert len(latencies.samples) == RESERVOIR_SIZE
+    summary = latencies.summary()
+    assert summary["calls"] == 10 * RESERVOIR_SIZE
+    assert summary["total_ns"] == sum(range(10 * RESERVOIR_SIZE))
+    assert summary["max_ns"] == 10 * RESERVOIR_SIZE - 1
+    assert summary["p50_ns"] <= summary["p90_ns"] <= summary["p99_ns"] <= summary["max_ns"]
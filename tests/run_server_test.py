@@ -0,0 +1,70 @@
+import json
+import socket
+import subprocess
+import sys
+import time
+from os.path import exists, join
+
+
+def requests(program_file: str):
+    return [
+        {"id": 1, "program": program_file},
+        {"id": 2, "source": "a = 1\nb = 2\nc = a + b\nprint(c)\n", "criterion": [4, None]},
+        {"id": 3, "source": "a = 1\nb = 2\nc = a + b\nprint(c)\n", "criterion": [3, ["a"]], "analysis": "dataflow"},
+        {"id": 4, "source": "while True:\n    pass\nprint(1)\n", "criterion": [3, None], "timeout": 0.5},
+        {"id": 5, "program": "does-not-exist.py"},
+    ]
+
+
+def check(responses, program_file: str):
+    with open(program_file.replace("program.py", "expected.py"), "r") as file:
+        expected = file.read()
+    assert [response["id"] for response in responses] == [1, 2, 3, 4, 5]
+    assert responses[0]["sliced"].strip() == expected.strip()
+    assert responses[1]["lines"] == [1, 2, 3, 4] and responses[1]["output"] == "3\n"
+    assert responses[2]["lines"] == [1, 3]
+    assert "timed out" in responses[3]["error"]
+    assert "FileNotFoundError" in responses[4]["error"]
+
+
+def test_server_stdio():
+    program_file = join("tests", "milestone3", "test_3", "program.py")
+    lines = "".join(json.dumps(request) + "\n" for request in requests(program_file))
+    output = subprocess.run(
+        [sys.executable, "-m", "dynamicslicing.server", "--stdio"], input=lines, capture_output=True, text=True, check=True
+    ).stdout
+    check([json.loads(line) for line in output.splitlines()], program_file)
+
+
+def test_server_socket(tmp_path):
+    program_file = join("tests", "milestone3", "test_3", "program.py")
+    socket_path = str(tmp_path / "slicing.sock")
+    server = subprocess.Popen([sys.executable, "-m", "dynamicslicing.server", "--socket", socket_path])
+    try:
+        for _ in range(100):
+            if exists(socket_path):
+                break
+            time.sleep(0.1)
+        # an idle connection does not hold up the others
+        idle = socket.socket(socket.AF_UNIX)
+        idle.connect(socket_path)
+        # each connection reuses the warm server
+        for _ in range(2):
+            with socket.socket(socket.AF_UNIX) as client:
+                client.connect(socket_path)
+                stream = client.makefile("rw")
+                responses = []
+                for request in requests(program_file):
+                    stream.write(json.dumps(request) + "\n")
+                    stream.flush()
+                    responses.append(json.loads(stream.readline()))
+                stream.close()
+                check(responses, program_file)
+        with socket.socket(socket.AF_UNIX) as client:
+            client.connect(socket_path)
+            client.sendall(b'{"shutdown": true}\n')
+        assert server.wait(timeout=10) == 0
+        idle.close()
+        assert not exists(socket_path)
+    finally:
+        server.kill()
@@ -0,0 +1,142 @@
+import gc
+
+from dynamicslicing.api import prepare, run, slice_source
+from dynamicslicing.shadow import MAX_LOOSE_OBJECTS
+
+
+def test_scopes_are_kept_apart():
+    source = "\n".join([
+        "def f(x):",
+        "    y = x + 1",
+        "    return y",
+        "",
+        "y = 10",
+        "z = f(2)",
+        "print(y)",
+    ]) + "\n"
+    # the name-based analysis cannot tell the local y from the global one
+    assert 2 in slice_source(source, criterion=(7, None)).lines
+    result = slice_source(source, criterion=(7, None), analysis="shadow")
+    assert result.lines == {5, 7}
+    assert result.output == "10\n"
+    assert slice_source(source, criterion=(6, {"z"}), analysis="shadow").lines == {1, 2, 3, 6}
+
+
+def test_object_cells():
+    source = "\n".join([
+        "class P:",
+        "    def __init__(self, n):",
+        "        self.n = n",
+        "",
+        "a = P(1)",
+        "b = P(2)",
+        "a.n = 5",
+        "b.n = 7",
+        "xs = [1, 2]",
+        "xs.append(3)",
+        "total = 0",
+        "for x in xs:",
+        "    if x > 1:",
+        "        total += x",
+        "print(a.n, total)",
+    ]) + "\n"
+    result = slice_source(source, criterion=(15, None), analysis="shadow")
+    assert 6 not in result.lines and 8 not in result.lines
+    assert {5, 7, 9, 10, 11, 12, 13, 14, 15} <= result.lines
+
+
+def test_forward_slice():
+    source = "\n".join([
+        "def f(x):",
+        "    y = x + 1",
+        "    return y",
+        "",
+        "total = 0",
+        "unused = 0",
+        "for i in range(500):",
+        "    total += f(i)",
+        "    unused += i",
+        "print(total)",
+    ]) + "\n"
+    slicer, code = prepare(source, (10, None), "forward")
+    result = run(slicer, code)
+    assert result.lines == {1, 2, 3, 5, 7, 8, 10}
+    assert result.sliced == slice_source(source, criterion=(10, None), analysis="shadow").sliced
+    # nothing is recorded while the program runs
+    assert not hasattr(slicer, "trace")
+
+
+def test_global_and_nonlocal_writes():
+    source = "\n".join([
+        "c = 0",
+        "def inc():",
+        "    global c",
+        "    c += 1",
+        "inc()",
+        "print(c)",
+    ]) + "\n"
+    # the declaration is kept with the write it scopes, so the slice still runs
+    result = slice_source(source, criterion=(6, None), analysis="shadow")
+    assert result.lines == {1, 2, 3, 4, 5, 6}
+    source = "\n".join([
+        "def make():",
+        "    n = 0",
+        "    def inc():",
+        "        nonlocal n",
+        "        n += 1",
+        "    inc()",
+        "    return n",
+        "x = make()",
+        "print(x)",
+    ]) + "\n"
+    assert {4, 5} <= slice_source(source, criterion=(9, None), analysis="shadow").lines
+
+
+def test_unreferenceable_objects_are_released():
+    source = "\n".join([
+        "for i in range(20000):",
+        "    tmp = [0] * 100",
+        "    tmp[0] = i",
+        "keep = [1]",
+        "keep[0] = 2",
+        "print(keep)",
+    ]) + "\n"
+    slicer, code = prepare(source, (6, None), "shadow")
+    result = run(slicer, code)
+    assert result.lines == {4, 5, 6}
+    # lists cannot be weakly referenced; once rebound only the last few keep their cells
+    assert len(slicer.shadow.cells) <= MAX_LOOSE_OBJECTS + 2
+    gc.collect()
+    assert sum(type(value) is list and len(value) == 100 for value in gc.get_objects()) <= MAX_LOOSE_OBJECTS + 2
+
+
+def test_forward_global_write():
+    source = "\n".join([
+        "c = 0",
+        "def inc():",
+        "    global c",
+        "    c += 1",
+        "inc()",
+        "print(c)",
+    ]) + "\n"
+    slicer, code = prepare(source, (6, None), "forward")
+    result = run(slicer, code)
+    assert result.lines == {1, 2, 3, 4, 5, 6}
+    assert result.sliced == slice_source(source, criterion=(6, None), analysis="shadow").sliced
+
+
+def test_forward_short_lived_containers():
+    source = "\n".join([
+        "for i in range(20000):",
+        "    tmp = [0] * 100",
+        "    tmp.append(i)",
+        "keep = [1]",
+        "keep[0] = 2",
+        "print(keep)",
+    ]) + "\n"
+    slicer, code = prepare(source, (6, None), "forward")
+    result = run(slicer, code)
+    assert result.lines == {4, 5, 6}
+    assert len(slicer.shadow.cells) <= MAX_LOOSE_OBJECTS + 2
+    gc.collect()
+    assert sum(type(value) is list and len(value) == 101 for value in gc.get_objects()) <= MAX_LOOSE_OBJECTS + 2
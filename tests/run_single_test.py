@@ -8,7 +8,7 @@ from typing import Tuple
 import libcst as cst
 import pytest
 
-from dynapyt.instrument.instrument import instrument_file
+from dynamicslicing.instrument_cache import instrument_file
 from dynapyt.utils.hooks import get_hooks_from_analysis
 from dynapyt.analyses.BaseAnalysis import BaseAnalysis
 